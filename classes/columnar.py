@@ -0,0 +1,138 @@
+import json
+import os
+import numpy as np
+
+# Size of the .npy header that is reserved for every column, such that the shape can be filled in when the column is
+# closed without moving the data
+HEADER_SIZE = 128
+
+
+def _header(dtype, shape):
+    """
+    :return: header of a version 1.0 .npy file of HEADER_SIZE bytes, padded with spaces
+    """
+    descr = np.lib.format.dtype_to_descr(np.dtype(dtype))
+    header = repr({"descr": descr, "fortran_order": False, "shape": tuple(shape)})
+    length = HEADER_SIZE - 10
+    if len(header) + 1 > length:
+        raise ValueError(f"The header of a column with dtype {dtype} and shape {shape} is too long")
+    return b"\x93NUMPY\x01\x00" + length.to_bytes(2, "little") + (header.ljust(length - 1) + "\n").encode("latin1")
+
+
+class ColumnWriter:
+    """
+    Writes a table to a directory with one .npy file per column, to which rows are appended in chunks, so the table
+    never has to be in memory as a whole. A column is one-dimensional or holds a fixed-length array per row (e.g. a
+    sequence). The directory also contains columns.json with the order of the columns and the categories of the
+    columns that hold codes, e.g. resource group names. The shape in the .npy headers is written by close(), after
+    which read_columns can memory map the columns.
+    """
+    def __init__(self, directory, dtypes, categories=None):
+        """
+        :param dtypes: dict with the dtype of every column, or a tuple (dtype, row shape) for array columns
+        :param categories: optional dict with the list of categories of the columns with codes
+        """
+        self.directory = directory
+        self.columns = list(dtypes)
+        self.dtypes = {}
+        self.row_shapes = {}
+        for name, dtype in dtypes.items():
+            dtype, row_shape = dtype if isinstance(dtype, tuple) else (dtype, ())
+            self.dtypes[name] = np.dtype(dtype)
+            self.row_shapes[name] = tuple(row_shape)
+        self.categories = categories or {}
+        self.nr_rows = 0
+        os.makedirs(directory, exist_ok=True)
+        # The table is only complete once columns.json is written
+        if os.path.exists(os.path.join(directory, "columns.json")):
+            os.remove(os.path.join(directory, "columns.json"))
+        self.files = {}
+        for name in self.columns:
+            self.files[name] = open(os.path.join(directory, f"{name}.npy"), "wb")
+            self.files[name].write(_header(self.dtypes[name], (0,) + self.row_shapes[name]))
+
+    def append(self, columns):
+        """
+        Append rows
+        :param columns: dict with an array of the new values of every column, all of the same length
+        """
+        nr_rows = None
+        for name in self.columns:
+            values = np.ascontiguousarray(columns[name], dtype=self.dtypes[name])
+            if values.shape[1:] != self.row_shapes[name]:
+                raise ValueError(f"Column {name} has rows of shape {self.row_shapes[name]}, not {values.shape[1:]}")
+            if nr_rows is None:
+                nr_rows = len(values)
+            elif len(values) != nr_rows:
+                raise ValueError("All columns need the same number of new rows")
+            self.files[name].write(values.tobytes())
+        self.nr_rows += nr_rows or 0
+
+    def flush(self):
+        """
+        Hand the appended rows to the operating system, they are only readable with read_columns after close()
+        """
+        for file in self.files.values():
+            file.flush()
+
+    def close(self):
+        for name in self.columns:
+            file = self.files[name]
+            file.seek(0)
+            file.write(_header(self.dtypes[name], (self.nr_rows,) + self.row_shapes[name]))
+            file.close()
+        with open(os.path.join(self.directory, "columns.json"), "w") as file:
+            json.dump({"columns": self.columns, "categories": self.categories, "rows": self.nr_rows}, file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_columns(directory, columns, categories=None):
+    """
+    Write a table of which all columns are in memory, see ColumnWriter
+    :param columns: dict with the array of every column
+    """
+    dtypes = {}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        dtypes[name] = (values.dtype, values.shape[1:])
+    with ColumnWriter(directory, dtypes, categories) as writer:
+        writer.append(columns)
+
+
+def read_columns(directory, mmap_mode="r"):
+    """
+    Read a table written by ColumnWriter. With mmap_mode "r" the columns are read-only memory maps, so nothing is
+    read until it is used.
+    :return: dict with the array of every column in the order of writing, and dict with the categories
+    """
+    with open(os.path.join(directory, "columns.json")) as file:
+        meta = json.load(file)
+    if meta["rows"] == 0:
+        # An empty file cannot be memory mapped
+        mmap_mode = None
+    columns = {}
+    for name in meta["columns"]:
+        columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+    return columns, meta["categories"]
+
+
+def is_columnar(location):
+    """
+    Whether location is a table of ColumnWriter, rather than a CSV file (.csv or .txt)
+    """
+    return not location.endswith((".csv", ".txt"))
+
+
+def find_table(location, suffix):
+    """
+    :return: location if it exists, otherwise location + suffix if that exists, such that tables of ColumnWriter
+    and CSV files of earlier runs (e.g. suffix .csv) can be read with the same location
+    """
+    if not os.path.exists(location) and os.path.exists(location + suffix):
+        return location + suffix
+    return location
@@ -0,0 +1,100 @@
+import numbers
+import weakref
+import numpy as np
+
+
+class CompiledActivity:
+    """
+    Record of an activity with everything that a simulator needs during a simulation: the duration bounds, the delay
+    after the start of the first activity of the product (TEMPORAL_RELATIONS[(0, i)], zero for the first activity)
+    and the resource group of every machine that it claims, both as index and as name.
+    """
+    __slots__ = ["product", "index", "low", "high", "delay", "groups", "names"]
+
+    def __init__(self, product, index, low, high, delay, groups, names):
+        self.product = product
+        self.index = index
+        self.low = low
+        self.high = high
+        self.delay = delay
+        self.groups = groups
+        self.names = names
+
+
+class CompiledPlan:
+    """
+    Flat representation of the products of a ProductionPlan, made once per plan by compile_plan. Activity i of
+    product p is activity a = ACTIVITY_OFFSET[p] + i of the arrays, and the machine claims of activity a are
+    REQUEST_GROUP[REQUEST_OFFSET[a]:REQUEST_OFFSET[a + 1]], in the order of the resource groups. ACTIVITIES[p] holds
+    the CompiledActivity records of product p, which the simulators use in their inner loops, and ACTIVITY_RECORDS[a]
+    the same records numbered as in the arrays.
+    """
+    __slots__ = ["NR_PRODUCTS", "NR_RESOURCES", "RESOURCE_NAMES", "CAPACITY", "ACTIVITY_OFFSET", "ACTIVITY_PRODUCT",
+                 "ACTIVITY_INDEX", "DURATION_LOW", "DURATION_HIGH", "DELAY", "REQUEST_OFFSET", "REQUEST_GROUP",
+                 "DEADLINE", "NR_CLAIMS", "INTEGRAL", "ACTIVITIES", "ACTIVITY_RECORDS"]
+
+    def __init__(self, plan):
+        self.RESOURCE_NAMES = plan.FACTORY.RESOURCE_NAMES
+        self.NR_RESOURCES = len(self.RESOURCE_NAMES)
+        self.CAPACITY = plan.FACTORY.CAPACITY
+        self.NR_PRODUCTS = len(plan.PRODUCTS)
+
+        self.ACTIVITIES = []
+        activity_offset = [0]
+        request_offset = [0]
+        request_group = []
+        nr_claims = []
+        integral = []
+        for p in range(0, self.NR_PRODUCTS):
+            product = plan.PRODUCTS[p]
+            records = []
+            for i in range(0, len(product.ACTIVITIES)):
+                activity = product.ACTIVITIES[i]
+                if i == 0:
+                    delay = 0
+                elif (0, i) in product.TEMPORAL_RELATIONS:
+                    delay = product.TEMPORAL_RELATIONS[(0, i)]
+                else:
+                    raise ValueError(f"Activity {i} of product {p} has no temporal relation with activity 0")
+                groups = []
+                for r in range(0, self.NR_RESOURCES):
+                    groups.extend([r] * activity.NEEDS[r])
+                low, high = activity.PROCESSING_TIME
+                records.append(CompiledActivity(p, i, low, high, delay, groups,
+                                                [self.RESOURCE_NAMES[r] for r in groups]))
+                request_group.extend(groups)
+                request_offset.append(len(request_group))
+            self.ACTIVITIES.append(records)
+            activity_offset.append(activity_offset[-1] + len(records))
+            nr_claims.append(sum(len(record.groups) for record in records))
+            integral.append(all(isinstance(t, numbers.Integral) for a in product.ACTIVITIES for t in a.PROCESSING_TIME)
+                            and all(isinstance(t, numbers.Integral) for t in product.TEMPORAL_RELATIONS.values()))
+
+        records = self.ACTIVITY_RECORDS = [record for product in self.ACTIVITIES for record in product]
+        self.ACTIVITY_OFFSET = np.array(activity_offset, dtype=np.int64)
+        self.ACTIVITY_PRODUCT = np.array([record.product for record in records], dtype=np.int64)
+        self.ACTIVITY_INDEX = np.array([record.index for record in records], dtype=np.int64)
+        self.DURATION_LOW = np.array([record.low for record in records])
+        self.DURATION_HIGH = np.array([record.high for record in records])
+        self.DELAY = np.array([record.delay for record in records])
+        self.REQUEST_OFFSET = np.array(request_offset, dtype=np.int64)
+        self.REQUEST_GROUP = np.array(request_group, dtype=np.int64)
+        self.DEADLINE = np.array([product.DEADLINE for product in plan.PRODUCTS])
+        # Number of machine claims of every product and whether all its times are integral
+        self.NR_CLAIMS = np.array(nr_claims, dtype=np.int64)
+        self.INTEGRAL = np.array(integral, dtype=bool)
+
+
+# Compiled plans by plan, a plan that is garbage collected is removed
+_compiled = weakref.WeakKeyDictionary()
+
+
+def compile_plan(plan):
+    """
+    :return: the CompiledPlan of plan, which is made on the first call. The products of a plan should not be changed
+    after it is compiled, make a copy of the plan instead (e.g. with copy.deepcopy).
+    """
+    compiled = _compiled.get(plan)
+    if compiled is None:
+        compiled = _compiled[plan] = CompiledPlan(plan)
+    return compiled
@@ -0,0 +1,149 @@
+import functools
+import json
+import multiprocessing
+import os
+import re
+import traceback
+import numpy as np
+import pandas as pd
+from classes.columnar import find_table, is_columnar, read_columns, write_columns
+from classes.history_log import HistoryLogReader, is_history_log
+
+
+def _run_one(run_setting, setting):
+    """
+    Run one setting of a grid. A failure is returned instead of raised, such that it does not stop the other settings.
+    :return: the row of the manifest and None, or the file name of the setting and the traceback if it failed
+    """
+    file_name = setting.make_file_name()
+    try:
+        row = dict(run_setting(setting))
+    except Exception:
+        return file_name, traceback.format_exc()
+    row["file_name"] = file_name
+    return row, None
+
+
+def _to_json(value):
+    # NumPy scalars, e.g. the budget or the fitness
+    return value.item()
+
+
+def append_manifest(manifest, row):
+    """
+    Append one row to the manifest, a JSON lines file. The row is written with a single write call, such that rows of
+    jobs that share the manifest are not interleaved.
+    """
+    line = json.dumps(row, default=_to_json) + "\n"
+    with open(manifest, "a") as file:
+        file.write(line)
+
+
+def read_manifest(manifest):
+    """
+    :return: DataFrame with one row per finished setting, empty if the manifest does not exist yet
+    """
+    if not os.path.exists(manifest):
+        return pd.DataFrame()
+    with open(manifest) as file:
+        return pd.DataFrame([json.loads(line) for line in file if line.strip()])
+
+
+def write_history(output_file, results):
+    """
+    Write the history of a search method, a DataFrame with one row per iteration in which the sequences are lists.
+    If output_file ends with .txt or .csv it is written as CSV, otherwise as a directory of columns in which every
+    sequence column is an int32 array with one row per iteration, see classes/columnar.py.
+    """
+    if not is_columnar(output_file):
+        results.to_csv(output_file, header=True, index=False)
+        return
+    columns = {}
+    for name in results.columns:
+        values = results[name].tolist()
+        if values and isinstance(values[0], (list, tuple, np.ndarray)):
+            columns[name] = np.array([np.asarray(value, dtype=np.int32) for value in values])
+        else:
+            columns[name] = np.array(values)
+    write_columns(output_file, columns)
+
+
+def _parse_sequence(text):
+    # Sequences in CSV files of earlier runs, written as a list "[2, 16, 14]", possibly of NumPy scalars
+    # "[np.int64(2), ...]", or as an array "[ 2 16 14]"
+    text = re.sub(r"np\.\w+\(([^)]*)\)", r"\1", text)
+    return np.array(text.strip("[]").replace(",", " ").split(), dtype=np.int32)
+
+
+def load_history(location):
+    """
+    Read a history written by write_history or by a HistoryLog of classes/history_log.py. Columns of a directory of
+    columns are memory mapped, the ones of a CSV file are parsed and the sequences of a HistoryLog are reconstructed.
+    If location does not exist, the CSV file location.txt of an earlier run is read.
+    :return: dict with an array per column, the sequence columns with one sequence per row, e.g.
+    load_history(location)["Best_sequence"][-1] is the final best sequence
+    """
+    location = find_table(location, ".txt")
+    if is_history_log(location):
+        return HistoryLogReader(location).to_columns()
+    if is_columnar(location):
+        return read_columns(location)[0]
+    data = pd.read_csv(location)
+    history = {}
+    for name in data.columns:
+        if name in ["Sequence", "Best_sequence"]:
+            history[name] = np.array([_parse_sequence(text) for text in data[name]])
+        else:
+            history[name] = data[name].to_numpy()
+    return history
+
+
+def history_exists(location):
+    """
+    Whether the history of a setting is written, either by write_history or as a CSV file location.txt
+    """
+    return os.path.exists(os.path.join(location, "columns.json")) or os.path.exists(f'{location}.txt')
+
+
+def run_grid(settings_list, run_setting, manifest, processes=1, shard=0, nr_shards=1):
+    """
+    Run an experiment grid: run_setting(setting) for every setting that has no row in the manifest yet, such that an
+    interrupted grid continues where it stopped. The row returned by run_setting is appended to the manifest, together
+    with the file name, as soon as the setting is finished; a setting is only done once its row is written. A setting
+    that raises is reported and run again when the grid is restarted, the other settings continue.
+    :param run_setting: module-level function of a Settings object that returns a dict with the results
+    :param processes: number of settings that are run in parallel on a process pool
+    :param shard: with nr_shards > 1, only setting j of the grid with j % nr_shards == shard is run, such that the
+    grid can be divided over independent jobs
+    :return: list of the rows of the settings that were run
+    """
+    done = set(read_manifest(manifest).get("file_name", []))
+    pending = []
+    for j, setting in enumerate(settings_list):
+        if j % nr_shards == shard and setting.make_file_name() not in done:
+            pending.append(setting)
+    print(f'Run {len(pending)} of the {len(settings_list)} settings, the others are done or in another shard')
+
+    run = functools.partial(_run_one, run_setting)
+    rows = []
+    failed = []
+
+    def finish(row, error):
+        if error is None:
+            append_manifest(manifest, row)
+            rows.append(row)
+        else:
+            print(f'Setting {row} failed:\n{error}')
+            failed.append(row)
+
+    if processes > 1 and len(pending) > 1:
+        with multiprocessing.Pool(min(processes, len(pending))) as pool:
+            for row, error in pool.imap_unordered(run, pending):
+                finish(row, error)
+    else:
+        for setting in pending:
+            finish(*run(setting))
+    if failed:
+        raise RuntimeError(f"{len(failed)} of the {len(pending)} settings failed and are run again when the grid is "
+                           f"restarted: {failed}")
+    return rows
@@ -0,0 +1,101 @@
+class ActivityState:
+    """
+    State of an activity of a product that is in the factory. Depending on the times that are known, the activity
+    is waiting (no start), processing (start and a finish that is not before the clock) or finished (a finish before
+    the clock).
+    """
+    __slots__ = ["machines", "start", "finish", "duration"]
+
+    def __init__(self, machines=None, start=None, finish=None, duration=None):
+        """
+        :param machines: list with the id of the machine that is claimed for every resource group of the activity, in
+        the order of its resources, or None for a machine that is not claimed yet. Machines of a waiting activity
+        can already be claimed.
+        :param start: time at which the processing started
+        :param finish: time at which the processing ends and the machines are released, for a started activity
+        :param duration: optional processing time of a waiting activity, by default it is drawn (or taken from the
+        durations of the simulation) at the warm start
+        """
+        self.machines = machines
+        self.start = start
+        self.finish = finish
+        self.duration = duration
+
+    def __repr__(self):
+        return (f'ActivityState(machines={self.machines}, start={self.start}, finish={self.finish}, '
+                f'duration={self.duration})')
+
+
+class ProductState:
+    """
+    State of a product that is released into the factory: its release time and the state of its activities. The
+    downstream activities are only requested once the first activity has started, so before that they are left out.
+    """
+    __slots__ = ["product", "release", "activities"]
+
+    def __init__(self, product, release, activities=None):
+        """
+        :param product: index of the product in the plan
+        :param release: time at which the product was released and requested the machines of its first activity
+        :param activities: list with the ActivityState of the first activities of the product, missing ones are
+        waiting without claimed machines
+        """
+        self.product = product
+        self.release = release
+        self.activities = list(activities or [])
+
+    def __repr__(self):
+        return f'ProductState(product={self.product}, release={self.release}, activities={self.activities})'
+
+
+class FactoryState:
+    """
+    State of the factory at time now, from which Simulator.simulate of classes/simulator_3_fast.py continues with
+    state=... instead of starting at time zero. It holds the products that are released, with the machines that
+    they claim and their activities that are waiting, processing or finished. The products of plan.SEQUENCE are
+    released after them, the first one at next_release and then one every 3 time units, as in the simulation.
+    Machine requests that wait for a machine are served in the order of waiting, or else in the order of their
+    request time (the release of the product for its first activity, the start of the first activity for the others)
+    and then in the order of the products in the state. Free machines are handed out in the order of free, or else in
+    the order of their ids. The events that are still to come (the end of a processing activity or of a delay, and
+    the next release) are processed in the order of events, or else in the order in which they are scheduled as far
+    as it follows from the state. Only with free, events and waiting, which Simulator.factory_state fills in, are
+    machines handed out and events at the same time processed in the same order as in the simulation.
+    """
+    def __init__(self, now, products=None, next_release=None, free=None, events=None, waiting=None):
+        """
+        :param now: current time, the simulation continues with the events at now
+        :param products: list of ProductState, in the order in which they were released. Finished products can be
+        left out, but they then do not count in the makespan and the tardiness.
+        :param next_release: time of the release of the first product of plan.SEQUENCE, now by default
+        :param free: optional dict with the ids of the free machines of every resource group (by name), in the order
+        in which they are handed out, e.g. the order in which they were released. A group that is left out hands out
+        its free machines in the order of their ids.
+        :param events: optional list with the events that are still to come in the order in which they were scheduled,
+        (product, activity) for the end of the processing or of the delay of an activity and None for the release of
+        the first product of plan.SEQUENCE
+        :param waiting: optional list with the requests that wait for a machine in the order in which they were made,
+        i.e. the get queue of the factory, as (product, activity) once for every machine that the activity still
+        needs, in the order of its resources. Without it, the requests are made in the order that is described above.
+        """
+        self.now = now
+        self.products = list(products or [])
+        self.next_release = now if next_release is None else next_release
+        self.free = {name: list(machines) for name, machines in (free or {}).items()}
+        self.events = None if events is None else [None if event is None else tuple(event) for event in events]
+        self.waiting = None if waiting is None else [tuple(request) for request in waiting]
+        if self.next_release < now:
+            raise ValueError(f"The next release at {self.next_release} is before the current time {now}")
+
+    @property
+    def released(self):
+        """
+        :return: list of the products in the state, which are not in the sequence that is simulated
+        """
+        return [product.product for product in self.products]
+
+    def __len__(self):
+        return len(self.products)
+
+    def __repr__(self):
+        return f'FactoryState(now={self.now}, {len(self.products)} products, next_release={self.next_release})'
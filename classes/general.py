@@ -1,5 +1,10 @@
 import copy
+import math
+import multiprocessing
+import pickle
+import statistics
 import numpy as np
+from collections import OrderedDict, namedtuple
 
 
 class Settings:
@@ -30,7 +35,154 @@ class Settings:
                    f'{self.instance}_objective={self.objective}_init={self.init}'
 
 
-def evaluator_simpy(plan, setting, sequence, sim_time=10000000, printing=False):
+class InstanceUnpickler(pickle.Unpickler):
+    """
+    Part of the instances in factory_data were pickled when the classes lived in the modules classes and
+    classes_alternative_2, map these onto classes.classes
+    """
+    def find_class(self, module, name):
+        if module in ["classes", "classes_alternative_2"]:
+            module = "classes.classes"
+        return super().find_class(module, name)
+
+
+def load_instance(file_name):
+    """
+    Load a pickled ProductionPlan or Factory from factory_data
+    :param file_name: path to the pickle file
+    """
+    with open(file_name, 'rb') as file:
+        return InstanceUnpickler(file).load()
+
+
+def sample_durations(plan, RANDOM_SEED):
+    """
+    Draw the processing time of every activity of every product of the plan once, for common random numbers: every
+    sequence that is simulated with the returned matrix gets the same durations, whatever the order in which the
+    simulator handles the activities, and no random numbers are drawn during the simulation.
+    :return: integer matrix with the duration of activity i of product p at [p, i], padded with zeros
+    """
+    nr_activities = max(len(product.ACTIVITIES) for product in plan.PRODUCTS)
+    low = np.zeros((len(plan.PRODUCTS), nr_activities), dtype=np.int64)
+    high = np.zeros((len(plan.PRODUCTS), nr_activities), dtype=np.int64)
+    for p, product in enumerate(plan.PRODUCTS):
+        for i, activity in enumerate(product.ACTIVITIES):
+            low[p, i], high[p, i] = activity.PROCESSING_TIME
+    return np.random.RandomState(RANDOM_SEED).randint(low, high + 1, dtype=np.int64)
+
+
+class FitnessCache:
+    """
+    Bounded LRU memo of simulation outcomes, such that sequences that are proposed again by a search method are not
+    simulated again. The key consists of the instance name, the simulator, the seed, the simulation time and the
+    sequence, packed into bytes, and the durations if they were sampled beforehand. The makespan and tardiness are
+    stored rather than the fitness, so the fitness is computed in exactly the same way for cached and simulated
+    outcomes.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(plan, setting, sequence, sim_time, durations=None):
+        key = plan.NAME, setting.simulator, setting.seed, sim_time, np.asarray(sequence, dtype=np.int32).tobytes()
+        if durations is not None:
+            key += (durations.tobytes(),)
+        return key
+
+    def get(self, key):
+        """
+        :return: the (makespan, tardiness) stored for key, or None
+        """
+        objectives = self.entries.get(key)
+        if objectives is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return objectives
+
+    def put(self, key, objectives):
+        self.entries[key] = objectives
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f'FitnessCache({self.hits} hits, {self.misses} misses, {len(self.entries)} entries)'
+
+
+class WorseThanCutoff(float):
+    """
+    Fitness returned by evaluator_simpy when the simulation is stopped at the cutoff: a lower bound on the fitness of
+    the sequence that is at least the cutoff. It compares as a float, so the methods, which only accept a fitness
+    strictly below the incumbent's, reject it the same as the full fitness.
+    """
+    def __repr__(self):
+        return f'WorseThanCutoff({float(self)})'
+
+
+class ScreenedOut(float):
+    """
+    Fitness returned by FitnessBound.screen of classes/lower_bound.py for a candidate that is not simulated: a lower
+    bound on the fitness of the sequence that is at least the cutoff, which compares as a float as WorseThanCutoff.
+    """
+    def __repr__(self):
+        return f'ScreenedOut({float(self)})'
+
+
+def history_fitness(fitness):
+    """
+    Fitness as it is written to the history of a search method. The lower bound of a screened candidate (ScreenedOut)
+    or of a simulation that is stopped at the cutoff (WorseThanCutoff) is not the simulated fitness, so it is written
+    as NaN and flagged in the columns Screened and Cut_off.
+    :return: fitness, screened, cut_off
+    """
+    if isinstance(fitness, ScreenedOut):
+        return math.nan, True, False
+    if isinstance(fitness, WorseThanCutoff):
+        return math.nan, False, True
+    return fitness, False, False
+
+
+def evaluator_simpy(plan, setting, sequence, sim_time=10000000, printing=False, cache=None, snapshot=None,
+                    prefix_cache=None, durations=None, stats=None, cutoff=None, bound=None, state=None):
+    """
+    :param cache: optional FitnessCache, the simulation is skipped if the sequence was simulated before
+    :param snapshot: optional Snapshot of the first products of the sequence made with snapshot_simpy, the
+    simulation resumes from it
+    :param prefix_cache: optional PrefixCache of classes/simulator_3_fast, the simulation resumes from the longest
+    prefix of the sequence that was simulated before. It is ignored for simulator_1 and simulator_2.
+    :param durations: optional matrix made with sample_durations for setting.seed, such that all sequences are
+    simulated with the same durations (common random numbers)
+    :param stats: optional SimulationStats of classes/simulation_stats.py, to which the profile of the simulation is
+    added (nothing is added if the sequence is found in the cache)
+    :param cutoff: optional fitness, e.g. of the incumbent, the simulation is stopped as soon as the fitness is known
+    to be at least the cutoff. The result is then a WorseThanCutoff, which is not put in the cache.
+    :param bound: optional FitnessBound of classes/lower_bound.py for the plan and the durations, with which the cutoff
+    is reached sooner
+    :param state: optional FactoryState of classes/factory_state.py from which the sequence is simulated, e.g. the
+    current state of the factory, then sequence holds the products that are not released yet. This is only supported
+    for simulator_3 (through simulator_3_fast), the cache, the prefix cache and the bound are not used.
+    """
+    plan.set_sequence(sequence)
+    if state is not None:
+        if setting.simulator not in ["simulator_3", "simulator_3_fast"]:
+            raise ValueError(f"A warm start from a FactoryState is not supported by {setting.simulator}")
+        if snapshot is not None:
+            raise ValueError("A simulation resumes from either a snapshot or a state")
+        cache = None
+        prefix_cache = None
+    if cache is not None:
+        key = cache.make_key(plan, setting, sequence, sim_time, durations)
+        objectives = cache.get(key)
+        if objectives is not None:
+            makespan, lateness = objectives
+            return setting.l1 * makespan + setting.l2 * lateness
 
     if setting.simulator == "simulator_1":
         from classes.simulator_1 import Simulator
@@ -38,10 +190,36 @@ def evaluator_simpy(plan, setting, sequence, sim_time=10000000, printing=False):
         from classes.simulator_2 import Simulator
     if setting.simulator == "simulator_3":
         from classes.simulator_3 import Simulator
+    if prefix_cache is not None and setting.simulator not in ["simulator_3", "simulator_3_fast"]:
+        prefix_cache = None
+    if setting.simulator == "simulator_3_fast" or snapshot is not None or prefix_cache is not None or state is not None:
+        # Snapshots and states are simulated by simulator_3_fast, which gives the same results as simulator_3
+        from classes.simulator_3_fast import Simulator
 
-    plan.set_sequence(sequence)
     simulator = Simulator(plan, printing=printing)
-    makespan, lateness = simulator.simulate(SIM_TIME=sim_time, RANDOM_SEED=setting.seed, write=False)
+    if snapshot is None and prefix_cache is not None:
+        makespan, lateness = prefix_cache.simulate(simulator, SIM_TIME=sim_time, RANDOM_SEED=setting.seed,
+                                                   durations=durations, stats=stats, cutoff=cutoff,
+                                                   l1=setting.l1, l2=setting.l2, bound=bound)
+    elif state is not None:
+        makespan, lateness = simulator.simulate(SIM_TIME=sim_time, RANDOM_SEED=setting.seed, write=False,
+                                                metrics_only=True, durations=durations, stats=stats, cutoff=cutoff,
+                                                l1=setting.l1, l2=setting.l2, state=state)
+    elif snapshot is None:
+        makespan, lateness = simulator.simulate(SIM_TIME=sim_time, RANDOM_SEED=setting.seed, write=False,
+                                                metrics_only=True, durations=durations, stats=stats, cutoff=cutoff,
+                                                l1=setting.l1, l2=setting.l2, bound=bound)
+    else:
+        makespan, lateness = simulator.simulate(SIM_TIME=sim_time, RANDOM_SEED=setting.seed, write=False,
+                                                metrics_only=True, snapshot=snapshot, durations=durations,
+                                                stats=stats, cutoff=cutoff, l1=setting.l1, l2=setting.l2,
+                                                bound=bound)
+    if simulator.cutoff_reached:
+        if printing:
+            print(f"Fitness is at least the cutoff {cutoff}")
+        return WorseThanCutoff(setting.l1 * makespan + setting.l2 * lateness)
+    if cache is not None:
+        cache.put(key, (makespan, lateness))
     fitness = setting.l1 * makespan + setting.l2 * lateness
 
     if printing:
@@ -52,6 +230,273 @@ def evaluator_simpy(plan, setting, sequence, sim_time=10000000, printing=False):
     return fitness
 
 
+def snapshot_simpy(plan, setting, prefix, sim_time=10000000, durations=None):
+    """
+    Simulate the fixed first products of a sequence once, such that evaluator_simpy can resume every sequence that
+    starts with them from the returned Snapshot. This is only supported for simulator_3 (through simulator_3_fast,
+    which gives the same results), for the other simulators None is returned and sequences are simulated in full.
+    :param prefix: list of the fixed products
+    """
+    if setting.simulator not in ["simulator_3", "simulator_3_fast"]:
+        return None
+    from classes.simulator_3_fast import Simulator
+
+    # Leave the sequence of the plan as it was
+    sequence = plan.SEQUENCE
+    plan.set_sequence(list(prefix))
+    snapshot = Simulator(plan).snapshot(SIM_TIME=sim_time, RANDOM_SEED=setting.seed, nr_fixed=len(prefix),
+                                        durations=durations)
+    plan.set_sequence(sequence)
+    return snapshot
+
+
+# State of a worker process of the BatchEvaluator: the plan, setting and simulation time to evaluate with
+_worker = {}
+
+
+def _init_worker(plan, setting, sim_time, durations=None):
+    _worker["plan"] = plan
+    _worker["setting"] = setting
+    _worker["sim_time"] = sim_time
+    _worker["durations"] = durations
+    _worker["cache"] = FitnessCache()
+
+
+def _evaluate_worker(sequence):
+    """
+    :return: the fitness of the sequence and its (makespan, tardiness), which the BatchEvaluator puts in its cache
+    """
+    cache = _worker["cache"]
+    fitness = evaluator_simpy(plan=_worker["plan"], setting=_worker["setting"], sequence=sequence,
+                              sim_time=_worker["sim_time"], durations=_worker["durations"], cache=cache)
+    key = cache.make_key(_worker["plan"], _worker["setting"], sequence, _worker["sim_time"], _worker["durations"])
+    return fitness, cache.entries.get(key)
+
+
+class BatchEvaluator:
+    """
+    Evaluates batches of sequences with evaluator_simpy on a persistent pool of worker processes. The plan is sent to
+    every worker once, when the pool is started. Every sequence is simulated with setting.seed, exactly as in a serial
+    call of evaluator_simpy, so the fitnesses do not depend on the worker or the order of evaluation.
+    """
+    def __init__(self, plan, setting, sim_time=10000000, processes=None, durations=None, cache=None):
+        """
+        :param processes: number of worker processes, all cores by default, or one in a worker process of another
+        pool (e.g. of run_grid in classes/experiments.py). With a single process the sequences are evaluated in the
+        current process.
+        :param durations: optional matrix made with sample_durations, see evaluator_simpy
+        :param cache: optional FitnessCache, e.g. the one of the serial evaluations of the method. Sequences that are
+        in it are not sent to the workers, and the outcomes of the workers are put in it.
+        """
+        self.plan = plan
+        self.setting = setting
+        self.sim_time = sim_time
+        self.durations = durations
+        self.cache = cache
+        if processes is None:
+            processes = 1 if multiprocessing.current_process().daemon else multiprocessing.cpu_count()
+        self.processes = processes
+        self.pool = None
+        if self.processes > 1:
+            self.pool = multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                             initargs=(plan, setting, sim_time, durations))
+
+    def evaluate(self, sequences):
+        """
+        Evaluate a list of sequences
+        :param sequences: list of sequences
+        :return: list with the fitness of each sequence
+        """
+        if self.pool is None or len(sequences) <= 1:
+            return [evaluator_simpy(plan=self.plan, setting=self.setting, sequence=sequence, sim_time=self.sim_time,
+                                    durations=self.durations, cache=self.cache) for sequence in sequences]
+        fitnesses = [None] * len(sequences)
+        keys = [None] * len(sequences)
+        if self.cache is not None:
+            for k, sequence in enumerate(sequences):
+                keys[k] = self.cache.make_key(self.plan, self.setting, sequence, self.sim_time, self.durations)
+                objectives = self.cache.get(keys[k])
+                if objectives is not None:
+                    makespan, lateness = objectives
+                    fitnesses[k] = self.setting.l1 * makespan + self.setting.l2 * lateness
+        rest = [k for k in range(0, len(sequences)) if fitnesses[k] is None]
+        chunksize = max(1, math.ceil(len(rest) / (4 * self.processes)))
+        results = self.pool.map(_evaluate_worker, [sequences[k] for k in rest], chunksize=chunksize)
+        for k, (fitness, objectives) in zip(rest, results):
+            fitnesses[k] = fitness
+            if self.cache is not None and objectives is not None:
+                self.cache.put(keys[k], objectives)
+        return fitnesses
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+Estimate = namedtuple('Estimate', 'mean, low, high, replications')
+
+
+def t_quantile(q, df):
+    """
+    Quantile of the Student t distribution with df degrees of freedom, exact for df <= 2 and otherwise by the
+    Cornish-Fisher expansion around the normal quantile (accurate to about 0.03 for df >= 3)
+    """
+    if df == 1:
+        return math.tan(math.pi * (q - 0.5))
+    if df == 2:
+        return (2 * q - 1) / math.sqrt(2 * q * (1 - q))
+    z = statistics.NormalDist().inv_cdf(q)
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2) + \
+        (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+
+
+def confidence_interval(samples, confidence=0.95):
+    """
+    :return: mean and the bounds of the t confidence interval of the mean of samples
+    """
+    mean = statistics.fmean(samples)
+    if len(samples) < 2:
+        return mean, -math.inf, math.inf
+    half_width = t_quantile(0.5 + confidence / 2, len(samples) - 1) * statistics.stdev(samples) / math.sqrt(len(samples))
+    return mean, mean - half_width, mean + half_width
+
+
+class RacingEvaluator:
+    """
+    Evaluates sequences with multiple replications, where replication r is simulated with seed setting.seed + r and,
+    with common_random_numbers, the durations of sample_durations for that seed. A candidate is raced against an
+    incumbent: replications are added to both until the confidence interval of their paired differences excludes
+    zero, i.e. the candidate is clearly better or worse, or until max_replications. The replications of every
+    sequence are kept, so the incumbent is not simulated again for each race. As the interval is checked after every
+    replication, the confidence level is nominal.
+
+    The evaluator can be used as f_eval of local_search and random_search, which accept a candidate if its fitness is
+    strictly below the fitness of the sequence that they compare it with. Every call races the sequence against that
+    incumbent, the first sequence or the last one that won a race. A candidate only wins if the race is decisive, i.e.
+    the interval lies below zero, and then becomes the incumbent. The returned fitness is the mean of the candidate,
+    moved to just below the fitness that was returned for the incumbent if the candidate wins and to at least that
+    fitness if it loses, such that the comparison of the method has the outcome of the race and the incumbent stays
+    the sequence of the method. iterated_greedy compares the candidates of a scan with each other, not with one
+    incumbent, so there evaluate should be used with the incumbent of the scan.
+    """
+    def __init__(self, plan, setting, sim_time=10000000, min_replications=2, max_replications=20, confidence=0.95,
+                 common_random_numbers=True, max_size=10000):
+        """
+        :param max_size: maximum number of sequences of which the replications are kept
+        """
+        self.plan = plan
+        self.setting = setting
+        self.sim_time = sim_time
+        self.min_replications = min_replications
+        self.max_replications = max_replications
+        self.confidence = confidence
+        self.common_random_numbers = common_random_numbers
+        self.max_size = max_size
+        self.samples = OrderedDict()
+        self.sequences = {}
+        self.durations = []
+        self.incumbent = None
+        # Fitness that was returned for the incumbent, with which the caller compares
+        self.incumbent_fitness = None
+        self.nr_evaluations = 0
+        self.nr_replications = 0
+
+    @staticmethod
+    def make_key(sequence):
+        return np.asarray(sequence, dtype=np.int32).tobytes()
+
+    def _samples(self, sequence):
+        key = self.make_key(sequence)
+        if key not in self.samples:
+            self.samples[key] = []
+            self.sequences[key] = np.array(sequence)
+            while len(self.samples) > self.max_size:
+                evicted = next(other for other in self.samples if other != self.incumbent)
+                del self.samples[evicted]
+                del self.sequences[evicted]
+        self.samples.move_to_end(key)
+        return key, self.samples[key]
+
+    def _replicate(self, key):
+        """
+        Add the next replication of the sequence with key
+        """
+        r = len(self.samples[key])
+        setting = copy.copy(self.setting)
+        setting.seed = self.setting.seed + r
+        durations = None
+        if self.common_random_numbers:
+            while len(self.durations) <= r:
+                self.durations.append(sample_durations(self.plan, self.setting.seed + len(self.durations)))
+            durations = self.durations[r]
+        self.samples[key].append(evaluator_simpy(plan=self.plan, setting=setting, sequence=self.sequences[key],
+                                                 sim_time=self.sim_time, durations=durations))
+        self.nr_replications += 1
+
+    def estimate(self, sequence):
+        """
+        :return: Estimate of the replications of sequence so far
+        """
+        samples = self.samples[self.make_key(sequence)]
+        return Estimate(*confidence_interval(samples, self.confidence), len(samples))
+
+    def evaluate(self, sequence, incumbent=None):
+        """
+        :param incumbent: optional sequence to race against, without it min_replications are used
+        :return: Estimate of the fitness of sequence: mean, confidence interval and number of replications
+        """
+        self.nr_evaluations += 1
+        key, samples = self._samples(sequence)
+        while len(samples) < self.min_replications:
+            self._replicate(key)
+        if incumbent is not None:
+            incumbent_key, incumbent_samples = self._samples(incumbent)
+            while incumbent_key != key:
+                while len(incumbent_samples) < len(samples):
+                    self._replicate(incumbent_key)
+                differences = [a - b for a, b in zip(samples, incumbent_samples)]
+                mean, low, high = confidence_interval(differences, self.confidence)
+                if low > 0 or high < 0 or low == high or len(samples) >= self.max_replications:
+                    break
+                self._replicate(key)
+        return Estimate(*confidence_interval(samples, self.confidence), len(samples))
+
+    def wins(self, sequence, incumbent):
+        """
+        :return: whether sequence is decisively better than incumbent in the replications so far
+        """
+        key, incumbent_key = self.make_key(sequence), self.make_key(incumbent)
+        if key == incumbent_key:
+            return False
+        differences = [a - b for a, b in zip(self.samples[key], self.samples[incumbent_key])]
+        return confidence_interval(differences, self.confidence)[2] < 0
+
+    def __call__(self, sequence, count_eval=None):
+        if self.incumbent is None:
+            estimate = self.evaluate(sequence)
+            self.incumbent = self.make_key(sequence)
+            self.incumbent_fitness = estimate.mean
+            return estimate.mean
+        incumbent = self.sequences[self.incumbent]
+        estimate = self.evaluate(sequence, incumbent)
+        if not self.wins(sequence, incumbent):
+            return max(estimate.mean, self.incumbent_fitness)
+        self.incumbent = self.make_key(sequence)
+        self.incumbent_fitness = min(estimate.mean, math.nextafter(self.incumbent_fitness, -math.inf))
+        return self.incumbent_fitness
+
+    def __repr__(self):
+        return f'RacingEvaluator({self.nr_evaluations} evaluations, {self.nr_replications} replications)'
+
+
 def combine_sequences(best_sequences, x=None):
     unique_months = list(best_sequences.keys())
     fermentation_sequence = []
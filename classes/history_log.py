@@ -0,0 +1,215 @@
+import os
+import numpy as np
+from classes.columnar import ColumnWriter, read_columns
+
+# Moves from the sequence of the previous iteration to the one of an iteration
+KEEP = 0
+SWAP = 1
+INSERT = 2
+SEQUENCE = 3
+MOVES = ["keep", "swap", "insert", "sequence"]
+
+
+def apply_move(sequence, move, i, j):
+    """
+    Apply a move to sequence in place: SWAP exchanges the products at positions i and j, INSERT moves the product at
+    position i to position j
+    """
+    if move == SWAP:
+        sequence[i], sequence[j] = sequence[j], sequence[i]
+    elif move == INSERT:
+        product = sequence[i]
+        if i < j:
+            sequence[i:j] = sequence[i + 1:j + 1].copy()
+        else:
+            sequence[j + 1:i + 1] = sequence[j:i].copy()
+        sequence[j] = product
+    elif move != KEEP:
+        raise ValueError(f"Move {MOVES[move]} cannot be applied, the sequence is in a snapshot")
+
+
+class HistoryLog:
+    """
+    Append-only history of a search method of which the memory use does not grow with the number of iterations. Every
+    iteration is one row of the columns Move, From, To, Fitness, Best, Best_fitness, Time, Screened and Cut_off, which
+    are written to disk in chunks:
+        - Move, From and To describe the sequence of the iteration as a move from the one of the previous iteration,
+          a swap of positions From and To, an insertion of the product at From at To, no change, or a new sequence;
+        - the full sequence is in the table snapshots/ when it is new and every snapshot_interval iterations, such that
+          the sequence of any iteration follows from the last snapshot before it and at most snapshot_interval moves;
+        - every best sequence is in the table bests/ once, Best is its row there;
+        - Fitness is NaN for a candidate that is screened or of which the simulation is stopped at the cutoff, which
+          Screened and Cut_off flag, see history_fitness of classes/general.py. Without flags, the log does not have
+          these two columns.
+    The directory is read with HistoryLogReader, or with load_history of classes/experiments.py like a history of
+    write_history.
+    """
+    COLUMNS = {"Move": np.int8, "From": np.int32, "To": np.int32, "Fitness": np.float64, "Best": np.int64,
+               "Best_fitness": np.float64, "Time": np.float64, "Screened": np.bool_, "Cut_off": np.bool_}
+
+    def __init__(self, location, n, snapshot_interval=100, chunk_size=1024, flags=True):
+        """
+        :param n: length of the sequences
+        :param flags: whether the log has the columns Screened and Cut_off, which a method that never logs a screened
+        or cut off candidate leaves out
+        """
+        self.location = location
+        self.n = n
+        self.snapshot_interval = snapshot_interval
+        self.chunk_size = chunk_size
+        self.column_types = {name: dtype for name, dtype in self.COLUMNS.items()
+                             if flags or name not in ["Screened", "Cut_off"]}
+        self.iterations = ColumnWriter(location, self.column_types)
+        self.snapshots = ColumnWriter(os.path.join(location, "snapshots"),
+                                      {"Row": np.int64, "Sequence": (np.int32, (n,))})
+        self.bests = ColumnWriter(os.path.join(location, "bests"), {"Sequence": (np.int32, (n,))})
+        self.buffer = {name: [] for name in self.column_types}
+        self.size = 0
+        self.current = None
+        self.last_snapshot = None
+        self.best = None
+        self.nr_bests = 0
+        self.closed = False
+
+    def _move(self, sequence):
+        """
+        :return: move, From and To from the sequence of the previous iteration to sequence
+        """
+        if self.current is None:
+            return SEQUENCE, -1, -1
+        changed = np.flatnonzero(sequence != self.current)
+        if len(changed) == 0:
+            return KEEP, -1, -1
+        a, b = changed[0].item(), changed[-1].item()
+        current = self.current
+        if len(changed) == 2 and sequence[a] == current[b] and sequence[b] == current[a]:
+            return SWAP, a, b
+        if sequence[b] == current[a] and np.array_equal(sequence[a:b], current[a + 1:b + 1]):
+            return INSERT, a, b
+        if sequence[a] == current[b] and np.array_equal(sequence[a + 1:b + 1], current[a:b]):
+            return INSERT, b, a
+        return SEQUENCE, -1, -1
+
+    def append(self, sequence, fitness, best_sequence, best_fitness, time, screened=False, cut_off=False):
+        """
+        Add an iteration, the same values as a row of the history of write_history
+        """
+        sequence = np.asarray(sequence, dtype=np.int32)
+        if sequence.shape != (self.n,):
+            raise ValueError(f"The log holds sequences of length {self.n}, not {len(sequence)}")
+        move, i, j = self._move(sequence)
+        if move == SEQUENCE or self.size - self.last_snapshot >= self.snapshot_interval:
+            self.snapshots.append({"Row": [self.size], "Sequence": sequence[None]})
+            self.last_snapshot = self.size
+        self.current = sequence.copy()
+
+        best_sequence = np.asarray(best_sequence, dtype=np.int32)
+        if self.best is None or not np.array_equal(best_sequence, self.best):
+            self.bests.append({"Sequence": best_sequence[None]})
+            self.best = best_sequence.copy()
+            self.nr_bests += 1
+
+        row = {"Move": move, "From": i, "To": j, "Fitness": fitness, "Best": self.nr_bests - 1,
+               "Best_fitness": best_fitness, "Time": time, "Screened": screened, "Cut_off": cut_off}
+        for name in self.column_types:
+            self.buffer[name].append(row[name])
+        self.size += 1
+        if len(self.buffer["Move"]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered iterations
+        """
+        if self.buffer["Move"]:
+            self.iterations.append(self.buffer)
+            self.buffer = {name: [] for name in self.column_types}
+        for writer in [self.iterations, self.snapshots, self.bests]:
+            writer.flush()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.snapshots.close()
+            self.bests.close()
+            # The log is complete once the iterations are
+            self.iterations.close()
+            self.closed = True
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def is_history_log(location):
+    return os.path.isdir(os.path.join(location, "snapshots"))
+
+
+class HistoryLogReader:
+    """
+    Reads a HistoryLog. The columns are memory mapped, the sequences are made on demand.
+    """
+    def __init__(self, location):
+        self.columns = read_columns(location)[0]
+        snapshots = read_columns(os.path.join(location, "snapshots"))[0]
+        self.snapshot_rows = np.asarray(snapshots["Row"])
+        self.snapshot_sequences = snapshots["Sequence"]
+        self.bests = read_columns(os.path.join(location, "bests"))[0]["Sequence"]
+
+    def __len__(self):
+        return len(self.columns["Move"])
+
+    def sequence(self, k):
+        """
+        :return: sequence of iteration k, from the last snapshot at or before it
+        """
+        k = range(len(self))[k]
+        s = np.searchsorted(self.snapshot_rows, k, side="right") - 1
+        sequence = np.array(self.snapshot_sequences[s])
+        moves, start, to = self.columns["Move"], self.columns["From"], self.columns["To"]
+        for row in range(self.snapshot_rows[s] + 1, k + 1):
+            apply_move(sequence, moves[row], start[row], to[row])
+        return sequence
+
+    def best_sequence(self, k):
+        """
+        :return: best sequence at iteration k
+        """
+        return np.array(self.bests[self.columns["Best"][k]])
+
+    def sequences(self):
+        """
+        Sequences of all iterations in order, each made from the one before
+        """
+        moves, start, to = self.columns["Move"], self.columns["From"], self.columns["To"]
+        sequence = None
+        s = 0
+        for row in range(0, len(self)):
+            if s < len(self.snapshot_rows) and self.snapshot_rows[s] == row:
+                sequence = np.array(self.snapshot_sequences[s])
+                s += 1
+            else:
+                apply_move(sequence, moves[row], start[row], to[row])
+            yield sequence.copy()
+
+    def to_columns(self):
+        """
+        :return: dict with the columns of a history of write_history, in which all sequences are in memory
+        """
+        n = self.snapshot_sequences.shape[1]
+        sequences = np.array(list(self.sequences()), dtype=np.int32).reshape(len(self), n)
+        columns = {"Sequence": sequences,
+                   "Fitness": self.columns["Fitness"],
+                   "Best_sequence": np.asarray(self.bests)[self.columns["Best"]],
+                   "Best_fitness": self.columns["Best_fitness"],
+                   "Time": self.columns["Time"]}
+        # Logs of earlier runs do not have the flags
+        for name in ["Screened", "Cut_off"]:
+            if name in self.columns:
+                columns[name] = self.columns[name]
+        return columns
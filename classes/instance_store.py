@@ -0,0 +1,103 @@
+import glob
+import json
+import os
+import pickle
+import numpy as np
+from classes.classes import ProductionPlan
+from classes.general import load_instance
+
+
+class InstanceStore:
+    """
+    Columnar store of production plans, in which every factory is kept once and every plan as a slice of the flat
+    arrays of product ids and deadlines. The arrays are memory mapped, so opening the store reads only the index, and
+    worker processes that open the same store share its pages. The directory contains:
+        index.json: name, ID, factory, offset and size of every plan
+        factories.pkl: dict with the Factory of every factory name
+        product_ids.npy, deadlines.npy: PRODUCT_IDS and DEADLINES of all plans after each other
+    """
+    def __init__(self, directory="factory_data/instance_store"):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as file:
+            self.index = {entry["name"]: entry for entry in json.load(file)}
+        with open(os.path.join(directory, "factories.pkl"), "rb") as file:
+            self.factories = pickle.load(file)
+        self.product_ids = np.load(os.path.join(directory, "product_ids.npy"), mmap_mode="r")
+        self.deadlines = np.load(os.path.join(directory, "deadlines.npy"), mmap_mode="r")
+
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def arrays(self, name):
+        """
+        :return: read-only views on the product ids and the deadlines of plan name
+        """
+        entry = self.index[name]
+        start, stop = entry["offset"], entry["offset"] + entry["size"]
+        return self.product_ids[start:stop], self.deadlines[start:stop]
+
+    def load(self, name):
+        """
+        Make the ProductionPlan with name, e.g. "120_3_factory_1". The plans of a factory share its Factory object, so
+        a plan of which the products are changed should be copied first (e.g. with copy.deepcopy).
+        """
+        entry = self.index[name]
+        product_ids, deadlines = self.arrays(name)
+        plan = ProductionPlan(ID=entry["ID"], SIZE=entry["size"], NAME=entry["plan_name"],
+                              FACTORY=self.factories[entry["factory"]], PRODUCT_IDS=product_ids.tolist(),
+                              DEADLINES=deadlines.tolist())
+        plan.list_products()
+        return plan
+
+
+def convert_instances(pattern="factory_data/instances/instance_*.pkl", directory="factory_data/instance_store"):
+    """
+    Write the pickled ProductionPlans of the files matching pattern to an InstanceStore in directory. The plans are
+    stored under the name in their file name, i.e. instance_{name}.pkl. Plans of factories with the same name must
+    have the same factory.
+    """
+    index = []
+    factories = {}
+    product_ids = []
+    deadlines = []
+    offset = 0
+    for file_name in sorted(glob.glob(pattern)):
+        plan = load_instance(file_name)
+        name = os.path.basename(file_name)[len("instance_"):-len(".pkl")]
+        factory = plan.FACTORY
+        if factory.NAME not in factories:
+            factories[factory.NAME] = factory
+        elif pickle.dumps(factories[factory.NAME]) != pickle.dumps(factory):
+            raise ValueError(f"Plan {name} has another factory {factory.NAME} than the plans before")
+        index.append({"name": name, "plan_name": plan.NAME, "ID": plan.ID, "factory": factory.NAME,
+                      "offset": offset, "size": len(plan.PRODUCT_IDS)})
+        product_ids.extend(plan.PRODUCT_IDS)
+        deadlines.extend(plan.DEADLINES)
+        offset += len(plan.PRODUCT_IDS)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "index.json"), "w") as file:
+        json.dump(index, file, indent=0)
+    with open(os.path.join(directory, "factories.pkl"), "wb") as file:
+        pickle.dump(factories, file)
+    np.save(os.path.join(directory, "product_ids.npy"), np.array(product_ids, dtype=np.int32))
+    np.save(os.path.join(directory, "deadlines.npy"), np.array(deadlines, dtype=np.int64))
+
+
+# Stores opened by load_plan, by directory
+_stores = {}
+
+
+def load_plan(name, directory="factory_data/instance_store"):
+    """
+    Load the ProductionPlan with name from the InstanceStore in directory, which is opened once per process
+    """
+    if directory not in _stores:
+        _stores[directory] = InstanceStore(directory)
+    return _stores[directory].load(name)
@@ -0,0 +1,126 @@
+import numpy as np
+from classes.compiled_plan import compile_plan
+from classes.general import ScreenedOut
+
+
+class FitnessBound:
+    """
+    Lower bound on the fitness l1 * makespan + l2 * tardiness of a sequence, computed from the plan without a
+    simulation. It holds for simulator_1, simulator_2, simulator_3 and simulator_3_fast, provided that the simulation
+    time is long enough for all products to finish:
+        - product k of the sequence is released at time 3k, and activity i of it cannot start before the release plus
+          TEMPORAL_RELATIONS[(0, i)], so the product cannot finish before the release plus the largest delay plus
+          duration of the activities that claim a machine (the finish time of a product is that of its last claim);
+        - the first activity of every product requests its machines at the release in all simulators, and the
+          requests for a resource group are served in the order in which they are made, so it cannot start before
+          the first activities of the products before it have kept the machines of the group busy;
+        - the machines of resource group r are busy for at least the total duration of the claims of the products that
+          are released at time 3k or later, which is spread over at most CAPACITY[r] machines after time 3k.
+    The makespan bound follows from the finish times and the machine time, the tardiness bound from the finish times
+    and from the machine time that the products that finish first have claimed.
+    """
+    def __init__(self, plan, setting, durations=None):
+        """
+        :param durations: optional matrix made with sample_durations, the same as given to the simulator. Without it
+        the lowest processing time of every activity is used.
+        """
+        compiled = compile_plan(plan)
+        self.l1 = setting.l1
+        self.l2 = setting.l2
+        self.INTEGRAL = bool(compiled.INTEGRAL.all())
+        self.DEADLINE = compiled.DEADLINE
+        self.CAPACITY = np.array(compiled.CAPACITY, dtype=np.float64)
+
+        # Per product: the largest delay plus duration of an activity with claims, and the claimed machine time
+        # per resource group
+        self.TAIL = np.full(compiled.NR_PRODUCTS, -np.inf)
+        self.WORK = np.zeros((compiled.NR_PRODUCTS, compiled.NR_RESOURCES))
+        # Duration of the first activity and its number of claims per resource group
+        self.FIRST = np.zeros(compiled.NR_PRODUCTS)
+        self.FIRST_CLAIMS = np.zeros((compiled.NR_PRODUCTS, compiled.NR_RESOURCES))
+        for record in compiled.ACTIVITY_RECORDS:
+            if not record.groups:
+                continue
+            duration = record.low if durations is None else durations[record.product, record.index]
+            self.TAIL[record.product] = max(self.TAIL[record.product], record.delay + duration)
+            for r in record.groups:
+                self.WORK[record.product, r] += duration
+            if record.index == 0:
+                self.FIRST[record.product] = duration
+                for r in record.groups:
+                    self.FIRST_CLAIMS[record.product, r] += 1
+        self.checked = 0
+        self.screened = 0
+
+    def objectives(self, sequence):
+        """
+        :return: lower bounds on the makespan and the tardiness of the sequence
+        """
+        _, makespan, tardiness = self.finish_bounds(sequence)
+        return makespan, tardiness
+
+    def finish_bounds(self, sequence):
+        """
+        :return: lower bounds on the finish time of the product at every position of the sequence, on the makespan
+        and on the tardiness
+        """
+        sequence = np.asarray(sequence, dtype=np.int64)
+        if len(sequence) == 0:
+            return np.zeros(0), 0, 0
+        release = 3 * np.arange(0, len(sequence))
+        finish = release + self.TAIL[sequence]
+
+        # The first activity of every product requests its machines at the release, and the requests of a resource
+        # group are served in order. Its machines are thus handed out after those of the first activities of the
+        # products before it, which all start on one of CAPACITY[r] machines before it and keep it busy for their
+        # duration. All but the last one on every machine have finished, so the start is at least their total
+        # duration over CAPACITY[r] minus the longest duration.
+        available = self.CAPACITY > 0
+        first = self.FIRST[sequence]
+        claims = self.FIRST_CLAIMS[sequence][:, available]
+        longest = np.maximum.accumulate(np.where(claims > 0, first[:, None], 0), axis=0)
+        start = np.cumsum(claims * first[:, None], axis=0) / self.CAPACITY[available] - longest
+        start = np.where(claims > 0, start, 0).max(axis=1, initial=0)
+        finish = np.maximum(finish, np.where(first > 0, start + first, -np.inf))
+        if self.INTEGRAL:
+            finish = np.ceil(finish)
+        deadline = self.DEADLINE[sequence]
+        tardiness = np.maximum(0, finish - deadline).sum()
+
+        # Whichever products finish first, the m-th finish time is at least the m-th smallest finish bound and at
+        # least the machine time of the m products with the least work per machine of a resource group. Matching
+        # these to the sorted deadlines bounds the tardiness as well, since the tardiness is convex in the finish time
+        work = self.WORK[sequence][:, available] / self.CAPACITY[available]
+        ordered = np.maximum(np.sort(finish), np.cumsum(np.sort(work, axis=0), axis=0).max(axis=1, initial=0))
+        if self.INTEGRAL:
+            ordered = np.ceil(ordered)
+        tardiness = max(tardiness, np.maximum(0, ordered - np.sort(deadline)).sum())
+
+        # Machine time that is claimed from time 3k on, per position k and resource group
+        load = release[:, None] + np.cumsum(work[::-1], axis=0)[::-1]
+        makespan = max(finish.max(), load.max(initial=-np.inf))
+        if self.INTEGRAL:
+            makespan = np.ceil(makespan)
+        return finish, makespan.item(), tardiness.item()
+
+    def fitness(self, sequence):
+        makespan, tardiness = self.objectives(sequence)
+        return self.l1 * makespan + self.l2 * tardiness
+
+    def screen(self, sequence, cutoff):
+        """
+        Screen a candidate against the fitness of the incumbent. The methods only accept a candidate with a fitness
+        strictly below the incumbent's, so a candidate of which the bound is at least the cutoff can be rejected
+        without simulating it.
+        :return: the bound as a ScreenedOut of classes/general.py if the candidate is screened out, None if it has to
+        be simulated
+        """
+        self.checked += 1
+        bound = self.fitness(sequence)
+        if bound >= cutoff:
+            self.screened += 1
+            return ScreenedOut(bound)
+        return None
+
+    def __repr__(self):
+        return f'FitnessBound({self.screened} of {self.checked} candidates screened)'
@@ -0,0 +1,111 @@
+from collections import deque, namedtuple
+from simpy.core import BoundClass
+from simpy.events import Event
+from simpy.resources.base import BaseResource, Get, Put
+
+Machine = namedtuple('Machine', 'resource_group, id')
+
+
+class MachinePoolPut(Put):
+    """
+    Request to put a machine back into the pool
+    """
+    def __init__(self, resource, item):
+        self.item = item
+        super().__init__(resource)
+
+
+class MachinePoolGet(Get):
+    """
+    Request to get a machine of a resource group from the pool
+    """
+    def __init__(self, resource, resource_group):
+        # Same as Get.__init__, except that the request is queued at its own resource group
+        Event.__init__(self, resource._env)
+        self.resource = resource
+        self.resource_group = resource_group
+        self.proc = self.env.active_process
+        resource._enqueue(self)
+        self.callbacks.append(resource._trigger_put)
+        resource._trigger_get(None)
+
+    def cancel(self):
+        if not self.triggered:
+            self.resource.waiting[self.resource_group].remove(self)
+
+
+class MachinePool(BaseResource):
+    """
+    Store of machines keyed by resource group, a replacement of the simpy.FilterStore with lambda filters on the
+    resource group. Every resource group has a FIFO list of free machines and a FIFO queue of waiting get requests,
+    such that get and put do not scan the machines and requests of the other resource groups. Machines are handed out
+    in the same order as by the FilterStore: waiting requests are served in the order in which they were made, and per
+    resource group the free machine that was put back first is handed out first (initially in the order of the ids).
+    """
+    def __init__(self, env, RESOURCE_NAMES, CAPACITY):
+        super().__init__(env, capacity=sum(CAPACITY))
+        self.free = {}
+        self.waiting = {}
+        for r in range(0, len(RESOURCE_NAMES)):
+            self.free[RESOURCE_NAMES[r]] = deque(Machine(RESOURCE_NAMES[r], j) for j in range(0, CAPACITY[r]))
+            self.waiting[RESOURCE_NAMES[r]] = deque()
+        self.nr_free = sum(CAPACITY)
+        # Resource groups with both free machines and waiting requests
+        self.dirty = []
+        self.nr_requests = 0
+
+    put = BoundClass(MachinePoolPut)
+    get = BoundClass(MachinePoolGet)
+
+    def _enqueue(self, event):
+        event.order = self.nr_requests
+        self.nr_requests += 1
+        self.waiting[event.resource_group].append(event)
+        if self.free[event.resource_group] and event.resource_group not in self.dirty:
+            self.dirty.append(event.resource_group)
+
+    def _do_put(self, event):
+        if self.nr_free < self._capacity:
+            resource_group = event.item.resource_group
+            self.free[resource_group].append(event.item)
+            self.nr_free += 1
+            if self.waiting[resource_group] and resource_group not in self.dirty:
+                self.dirty.append(resource_group)
+            event.succeed()
+
+    def _trigger_get(self, put_event):
+        if not self.dirty:
+            return
+        served = []
+        for resource_group in self.dirty:
+            free = self.free[resource_group]
+            waiting = self.waiting[resource_group]
+            while free and waiting:
+                served.append((waiting.popleft(), free.popleft()))
+        self.dirty = []
+        self.nr_free -= len(served)
+        if len(served) > 1:
+            served.sort(key=lambda request: request[0].order)
+        for get_event, machine in served:
+            get_event.succeed(machine)
+
+
+class ProfiledMachinePool(MachinePool):
+    """
+    MachinePool that also counts the machines that are put back and the largest number of requests that wait at the
+    same time, for SimulationStats of classes/simulation_stats.py. It hands out the same machines as MachinePool.
+    """
+    def __init__(self, env, RESOURCE_NAMES, CAPACITY):
+        super().__init__(env, RESOURCE_NAMES, CAPACITY)
+        self.nr_puts = 0
+        self.peak_waiting = 0
+
+    def _do_put(self, event):
+        self.nr_puts += 1
+        return super()._do_put(event)
+
+    def _trigger_get(self, put_event):
+        super()._trigger_get(put_event)
+        waiting = sum(len(requests) for requests in self.waiting.values())
+        if waiting > self.peak_waiting:
+            self.peak_waiting = waiting
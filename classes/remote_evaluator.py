@@ -0,0 +1,293 @@
+import copy
+import math
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from multiprocessing.connection import Client, Listener, wait
+from classes.general import evaluator_simpy
+
+# Environment variable with the key that workers and the broker authenticate each other with
+AUTHKEY_VARIABLE = "EVALUATION_AUTHKEY"
+
+
+def default_authkey():
+    """
+    :return: the key in the environment variable EVALUATION_AUTHKEY, or a random key for a broker with local workers
+    """
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    return key.encode() if key else os.urandom(16)
+
+
+def run_worker(address, authkey=None, connect_timeout=60):
+    """
+    Evaluate batches of sequences for a RemoteEvaluator until it closes. The messages of the broker are:
+        ("plan", key, plan, setting, sim_time, durations): the plan to evaluate with, sent once per worker
+        ("evaluate", key, batch, sequences, seed, simulator): a batch of sequences of the plan with key, which are
+            simulated with evaluator_simpy with seed and simulator instead of those of the setting
+        ("stop",): the broker closes
+    The worker answers every batch with ("fitness", batch, fitnesses), or ("error", batch, traceback) if the
+    evaluation raised an exception.
+    :param address: (host, port) of a TCP broker or the path of a Unix socket
+    :param authkey: key of the broker, by default the one in the environment variable EVALUATION_AUTHKEY
+    :param connect_timeout: seconds to keep trying to connect while the broker is not listening yet
+    """
+    if authkey is None:
+        authkey = os.environ[AUTHKEY_VARIABLE].encode()
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            connection = Client(address, authkey=authkey)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.5)
+
+    plans = {}
+    with connection:
+        connection.send(("ready", f"{socket.gethostname()}:{os.getpid()}"))
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "stop":
+                return
+            if message[0] == "plan":
+                key, plan, setting, sim_time, durations = message[1:]
+                plans[key] = (plan, setting, sim_time, durations)
+            elif message[0] == "evaluate":
+                key, batch, sequences, seed, simulator = message[1:]
+                try:
+                    plan, setting, sim_time, durations = plans[key]
+                    setting = copy.copy(setting)
+                    setting.seed = seed
+                    setting.simulator = simulator
+                    fitnesses = [evaluator_simpy(plan=plan, setting=setting, sequence=sequence, sim_time=sim_time,
+                                                 durations=durations) for sequence in sequences]
+                    answer = ("fitness", batch, fitnesses)
+                except Exception:
+                    answer = ("error", batch, traceback.format_exc())
+                try:
+                    connection.send(answer)
+                except OSError:
+                    # The broker closed the connection, e.g. because the batch took too long
+                    return
+
+
+class _Worker:
+    __slots__ = ["connection", "name", "plans", "batch", "sent"]
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.plans = set()
+        self.batch = None
+        self.sent = None
+
+
+class RemoteEvaluator:
+    """
+    Broker that evaluates batches of sequences with evaluator_simpy on workers that connect to it over TCP or a Unix
+    socket, e.g. on other machines with
+        EVALUATION_AUTHKEY=... python run_evaluation_worker.py --host broker-host --port 6000
+    A worker gets the plan once and then batches of sequences, see run_worker. A batch of a worker that is lost (its
+    connection breaks or it does not answer within batch_timeout) is sent to another worker, at most max_retries
+    times. Every sequence is simulated with setting.seed, as in a serial call of evaluator_simpy, so the fitnesses do
+    not depend on the worker. It can be used as f_eval (evaluator(x, i)) and as f_eval_batch (evaluator.evaluate) of
+    the methods, and in place of BatchEvaluator.
+    """
+    def __init__(self, plan, setting, sim_time=10000000, durations=None, address=("localhost", 0), authkey=None,
+                 local_workers=0, batch_size=None, batch_timeout=300, max_retries=3, worker_timeout=60):
+        """
+        :param address: (host, port) to listen on, port 0 picks a free port, or the path of a Unix socket. The
+        address that workers connect to is self.address.
+        :param authkey: key that workers have to know, by default the one in the environment variable
+        EVALUATION_AUTHKEY or a random one
+        :param local_workers: number of worker processes to start on this machine
+        :param batch_size: number of sequences per batch, by default the sequences of a call are spread evenly over
+        four batches per worker
+        :param batch_timeout: seconds after which a worker that has not answered a batch is considered lost
+        :param max_retries: number of times a batch is sent again after its worker was lost
+        :param worker_timeout: seconds to wait for a worker when there is none
+        """
+        self.plan = plan
+        self.setting = setting
+        self.sim_time = sim_time
+        self.durations = durations
+        self.authkey = default_authkey() if authkey is None else authkey
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.max_retries = max_retries
+        self.worker_timeout = worker_timeout
+        self.key = uuid.uuid4().hex
+        self.workers = []
+        # Batches get increasing ids, such that a late answer to a batch of an earlier call is recognized
+        self.nr_batches = 0
+        self.nr_lost = 0
+        self.nr_retries = 0
+
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.connections = queue.Queue()
+        self.closed = False
+        self.accepting = threading.Thread(target=self._accept, daemon=True)
+        self.accepting.start()
+
+        self.processes = []
+        context = multiprocessing.get_context("spawn")
+        for _ in range(0, local_workers):
+            process = context.Process(target=run_worker, args=(self.address, self.authkey), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def _accept(self):
+        """
+        Accept workers until the listener is closed, a worker is put in use by evaluate
+        """
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                # A closed listener, or a client with another key
+                continue
+            self.connections.put(connection)
+
+    def _add_workers(self, block=False):
+        timeout = self.worker_timeout if block else None
+        while True:
+            try:
+                connection = self.connections.get(block=block, timeout=timeout)
+            except queue.Empty:
+                return
+            block = False
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                continue
+            if message[0] == "ready":
+                self.workers.append(_Worker(connection, message[1]))
+
+    def _lose(self, worker, pending, first):
+        """
+        Drop a worker of which the connection broke or that timed out, its batch is evaluated again
+        """
+        self.workers.remove(worker)
+        self.nr_lost += 1
+        worker.connection.close()
+        if worker.batch is not None and worker.batch >= first:
+            pending.appendleft(worker.batch - first)
+            self.nr_retries += 1
+
+    def evaluate(self, sequences, count_eval=None):
+        """
+        Evaluate a list of sequences
+        :param sequences: list of sequences
+        :param count_eval: ignored, such that evaluate can be used as f_eval_batch of the methods
+        :return: list with the fitness of each sequence
+        """
+        sequences = [[int(i) for i in sequence] for sequence in sequences]
+        if not sequences:
+            return []
+        self._add_workers()
+        if not self.workers:
+            self._add_workers(block=True)
+        batch_size = self.batch_size or max(1, math.ceil(len(sequences) / (4 * max(1, len(self.workers)))))
+        batches = [(start, min(start + batch_size, len(sequences))) for start in range(0, len(sequences), batch_size)]
+        first = self.nr_batches
+        self.nr_batches += len(batches)
+        pending = deque(range(0, len(batches)))
+        attempts = [0] * len(batches)
+        fitnesses = [None] * len(sequences)
+        nr_done = 0
+
+        while nr_done < len(batches):
+            self._add_workers()
+            if not self.workers:
+                self._add_workers(block=True)
+                if not self.workers:
+                    raise RuntimeError(f"No worker connected to {self.address} within {self.worker_timeout} seconds")
+
+            # Hand out the pending batches to the idle workers
+            for worker in list(self.workers):
+                if not pending:
+                    break
+                if worker.batch is not None:
+                    continue
+                batch = pending.popleft()
+                if attempts[batch] > self.max_retries:
+                    raise RuntimeError(f"Batch {batch} is lost {attempts[batch]} times, the workers are lost")
+                attempts[batch] += 1
+                worker.batch = first + batch
+                worker.sent = time.time()
+                start, stop = batches[batch]
+                try:
+                    if self.key not in worker.plans:
+                        worker.connection.send(("plan", self.key, self.plan, self.setting, self.sim_time,
+                                                self.durations))
+                        worker.plans.add(self.key)
+                    worker.connection.send(("evaluate", self.key, first + batch, sequences[start:stop],
+                                            self.setting.seed, self.setting.simulator))
+                except (OSError, ValueError):
+                    self._lose(worker, pending, first)
+
+            # Collect the answers, and find the workers that are lost
+            busy = [worker for worker in self.workers if worker.batch is not None]
+            ready = wait([worker.connection for worker in busy], timeout=1)
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        message = worker.connection.recv()
+                    except (EOFError, OSError):
+                        self._lose(worker, pending, first)
+                        continue
+                    worker.batch = None
+                    if message[1] < first:
+                        # Answer to a batch of a call that was interrupted by an error
+                        continue
+                    if message[0] == "error":
+                        raise RuntimeError(f"Worker {worker.name} could not evaluate a batch:\n{message[2]}")
+                    start, stop = batches[message[1] - first]
+                    fitnesses[start:stop] = message[2]
+                    nr_done += 1
+                elif self.batch_timeout is not None and time.time() - worker.sent > self.batch_timeout:
+                    self._lose(worker, pending, first)
+        return fitnesses
+
+    def __call__(self, sequence, count_eval=None):
+        """
+        Evaluate one sequence, such that the evaluator can be used as f_eval of the methods
+        """
+        return self.evaluate([sequence])[0]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._add_workers()
+        for worker in self.workers:
+            try:
+                worker.connection.send(("stop",))
+            except (OSError, ValueError):
+                pass
+            worker.connection.close()
+        self.workers = []
+        self.listener.close()
+        for process in self.processes:
+            process.join(timeout=10)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return (f'RemoteEvaluator({len(self.workers)} workers at {self.address}, {self.nr_lost} lost, '
+                f'{self.nr_retries} batches sent again)')
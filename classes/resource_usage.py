@@ -0,0 +1,364 @@
+import math
+import numpy as np
+import pandas as pd
+from classes.columnar import ColumnWriter, find_table, is_columnar, read_columns, write_columns
+from classes.compiled_plan import compile_plan
+
+
+def check_finished(products, finished):
+    """
+    Raise a ValueError if one of the products has not released a machine, e.g. because the simulation time is too
+    short, such that it has no finish time for the makespan and the tardiness
+    :param finished: list with whether each of the products has released a machine
+    """
+    if not all(finished):
+        unfinished = sorted({int(p) for p, done in zip(products, finished) if not done})
+        raise ValueError(f"Products {unfinished} have no finish time, the simulation stopped before they released a "
+                         f"machine. Increase SIM_TIME.")
+
+
+class ResourceUsage:
+    """
+    Columnar recorder of the resource usage of a simulation. Every released machine is one row. The columns are typed
+    NumPy arrays that are preallocated for the number of machine claims of the production plan, resource groups are
+    stored as codes into RESOURCE_NAMES. A DataFrame or CSV file is only made on demand.
+    """
+    COLUMNS = ["Activity", "Product", "Resource", "Check_resource_type", "Machine_id", "Request moment",
+               "Retrieve moment", "Start", "Finish"]
+    FIELDS = ["activity", "product", "resource", "check_resource_type", "machine_id", "request", "retrieve", "start",
+              "finish"]
+
+    def __init__(self, plan, sequence=None, size=None):
+        """
+        :param plan: Class ProductionPlan
+        :param sequence: products that will be simulated, all products of the plan by default
+        :param size: number of rows to preallocate, by default the number of machine claims of the sequence
+        """
+        compiled = compile_plan(plan)
+        self.RESOURCE_NAMES = compiled.RESOURCE_NAMES
+        self.RESOURCE_CODES = {name: r for r, name in enumerate(self.RESOURCE_NAMES)}
+        self.NR_PRODUCTS = compiled.NR_PRODUCTS
+        if sequence is None:
+            sequence = range(0, self.NR_PRODUCTS)
+        sequence = list(sequence)
+
+        # Every activity claims one machine per unit it needs
+        if size is None:
+            size = compiled.NR_CLAIMS[sequence].sum()
+        time_type = np.int64 if compiled.INTEGRAL[sequence].all() else np.float64
+
+        self.size = 0
+        self.activity = np.empty(size, dtype=np.int64)
+        self.product = np.empty(size, dtype=np.int64)
+        self.resource = np.empty(size, dtype=np.int64)
+        self.check_resource_type = np.empty(size, dtype=np.int64)
+        self.machine_id = np.empty(size, dtype=np.int64)
+        self.request = np.empty(size, dtype=time_type)
+        self.retrieve = np.empty(size, dtype=time_type)
+        self.start = np.empty(size, dtype=time_type)
+        self.finish = np.empty(size, dtype=time_type)
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self.activity))
+        for name in self.FIELDS:
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def record(self, activity, product, resource, check_resource_type, machine_id, request, retrieve, start, finish):
+        """
+        Record the claim of a machine, which is released at time finish
+        :param resource: name of the requested resource group
+        :param check_resource_type: resource group of the machine that was handed out
+        """
+        k = self.size
+        if k == len(self.activity):
+            self._grow()
+        self.activity[k] = activity
+        self.product[k] = product
+        self.resource[k] = self.RESOURCE_CODES[resource]
+        self.check_resource_type[k] = self.RESOURCE_CODES[check_resource_type]
+        self.machine_id[k] = machine_id
+        self.request[k] = request
+        self.retrieve[k] = retrieve
+        self.start[k] = start
+        self.finish[k] = finish
+        self.size = k + 1
+
+    def __len__(self):
+        return self.size
+
+    def product_finish(self, products):
+        """
+        Finish time of the last machine claim of each of the products
+        :param products: list of product indices
+        """
+        finish = np.full(self.NR_PRODUCTS, np.iinfo(np.int64).min, dtype=self.finish.dtype)
+        np.maximum.at(finish, self.product[:self.size], self.finish[:self.size])
+        recorded = np.zeros(self.NR_PRODUCTS, dtype=bool)
+        recorded[self.product[:self.size]] = True
+        check_finished(products, recorded[products].tolist())
+        return finish[products]
+
+    def to_dataframe(self):
+        names = np.array(self.RESOURCE_NAMES, dtype=object)
+        columns = [self.activity, self.product, names[self.resource[:self.size]].tolist(),
+                   names[self.check_resource_type[:self.size]].tolist(), self.machine_id, self.request,
+                   self.retrieve, self.start, self.finish]
+        data = {}
+        for name, column in zip(self.COLUMNS, columns):
+            data[name] = column[:self.size]
+        return pd.DataFrame(data)
+
+    def to_csv(self, output_location):
+        self.to_dataframe().to_csv(output_location)
+
+    def columns(self):
+        """
+        :return: dict with the recorded part of every column, resource groups as codes into RESOURCE_NAMES
+        """
+        return {name: getattr(self, field)[:self.size] for name, field in zip(self.COLUMNS, self.FIELDS)}
+
+    def write(self, output_location):
+        """
+        Write the rows to a CSV file if output_location ends with .csv, otherwise to a directory of columns that is
+        read with load_resource_usage
+        """
+        if is_columnar(output_location):
+            write_columns(output_location, self.columns(), categories=self.categories())
+        else:
+            self.to_csv(output_location)
+
+    def categories(self):
+        return {"Resource": list(self.RESOURCE_NAMES), "Check_resource_type": list(self.RESOURCE_NAMES)}
+
+
+class ResourceUsageWriter:
+    """
+    Streaming counterpart of ResourceUsage for long simulations: the rows are collected in a ResourceUsage of
+    chunk_size rows, which is appended to output_location whenever it is full, so the memory use does not grow with
+    the length of the simulation. Like FinishTimes, the running finish time of every product is kept for the makespan
+    and the tardiness. The output is the same as that of ResourceUsage.write, a CSV file if output_location ends with
+    .csv and a directory of columns otherwise. The file is complete after write (or close).
+    """
+    def __init__(self, plan, output_location, sequence=None, chunk_size=65536):
+        self.output_location = output_location
+        self.chunk = ResourceUsage(plan, sequence, size=chunk_size)
+        self.chunk_size = chunk_size
+        self.finish = [-math.inf] * len(plan.PRODUCTS)
+        self.size = 0
+        self.writer = None
+        if is_columnar(output_location):
+            dtypes = {name: column.dtype for name, column in self.chunk.columns().items()}
+            self.writer = ColumnWriter(output_location, dtypes, categories=self.chunk.categories())
+        self.closed = False
+
+    def record(self, activity, product, resource, check_resource_type, machine_id, request, retrieve, start, finish):
+        self.chunk.record(activity, product, resource, check_resource_type, machine_id, request, retrieve, start,
+                          finish)
+        if finish > self.finish[product]:
+            self.finish[product] = finish
+        self.size += 1
+        if self.chunk.size == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Append the buffered rows to the output
+        """
+        if self.writer is not None:
+            self.writer.append(self.chunk.columns())
+        elif self.chunk.size > 0 or self.size == 0:
+            # The CSV file continues the row numbers of the previous chunks, the header is written with the first
+            rows = self.chunk.to_dataframe()
+            first = self.size - self.chunk.size
+            rows.index += first
+            rows.to_csv(self.output_location, mode="w" if first == 0 else "a", header=first == 0)
+        self.chunk.size = 0
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            if self.writer is not None:
+                self.writer.close()
+            self.closed = True
+
+    def write(self, output_location):
+        """
+        Write the remaining rows, the same as close(). The rows are always written to the output_location of the
+        constructor.
+        """
+        if output_location != self.output_location:
+            raise ValueError(f"The resource usage is streamed to {self.output_location}, not to {output_location}")
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def product_finish(self, products):
+        """
+        Finish time of the last machine claim of each of the products
+        :param products: list of product indices
+        """
+        finish = [self.finish[p] for p in products]
+        check_finished(products, [finish_p != -math.inf for finish_p in finish])
+        return np.array(finish)
+
+
+def load_resource_usage(location):
+    """
+    Read the resource usage written by ResourceUsage.write or ResourceUsageWriter, as a DataFrame with the columns of
+    ResourceUsage.COLUMNS. The numeric columns of a directory of columns are memory mapped. If location does not
+    exist, the CSV file location.csv of an earlier run is read.
+    """
+    location = find_table(location, ".csv")
+    if not is_columnar(location):
+        return pd.read_csv(location, index_col=0)
+    columns, categories = read_columns(location)
+    for name, names in categories.items():
+        columns[name] = np.array(names, dtype=object)[columns[name]]
+    return pd.DataFrame(columns, copy=False)
+
+
+class FinishTimes:
+    """
+    Objective-only counterpart of ResourceUsage, which keeps the running finish time of every product instead of
+    the rows. This suffices for the makespan and the tardiness.
+    """
+    def __init__(self, plan):
+        self.finish = [-math.inf] * len(plan.PRODUCTS)
+        # Number of released machines per product
+        self.claims = [0] * len(plan.PRODUCTS)
+        self.size = 0
+
+    def record(self, activity, product, resource, check_resource_type, machine_id, request, retrieve, start, finish):
+        if finish > self.finish[product]:
+            self.finish[product] = finish
+        self.claims[product] += 1
+        self.size += 1
+
+    def copy(self):
+        """
+        :return: FinishTimes with a copy of the recorded finish times, also of a subclass such as CutoffFinishTimes
+        """
+        copied = FinishTimes.__new__(FinishTimes)
+        copied.finish = list(self.finish)
+        copied.claims = list(self.claims)
+        copied.size = self.size
+        return copied
+
+    def __len__(self):
+        return self.size
+
+    def product_finish(self, products):
+        """
+        Finish time of the last machine claim of each of the products
+        :param products: list of product indices
+        """
+        finish = [self.finish[p] for p in products]
+        check_finished(products, [finish_p != -math.inf for finish_p in finish])
+        return np.array(finish)
+
+
+class CutoffReached(Exception):
+    """
+    Raised by CutoffFinishTimes to stop the simulation, with the lower bounds on the objectives at that moment
+    """
+    def __init__(self, makespan, tardiness):
+        super().__init__(makespan, tardiness)
+        self.makespan = makespan
+        self.tardiness = tardiness
+
+
+class CutoffFinishTimes(FinishTimes):
+    """
+    FinishTimes that stops the simulation with CutoffReached as soon as l1 * makespan + l2 * tardiness is known to be
+    at least cutoff. Machines are released in the order of time, so when a machine is released at time now:
+        - the makespan is at least now;
+        - a product of which not all machines are released yet finishes at now or later, so its tardiness is at least
+          now minus its deadline. The tardiness of the other products is known.
+    Both bounds only increase during the simulation. With a FitnessBound of classes/lower_bound.py they start from its
+    bounds on the finish times, the makespan and the tardiness. They are kept up to date in constant time per
+    release, with the products that are not finished yet in the order in which their bound starts to increase.
+    """
+    def __init__(self, plan, sequence, l1, l2, cutoff, recorded=None, bound=None):
+        """
+        :param sequence: products that are simulated
+        :param recorded: optional FinishTimes of the part of the simulation that is already done, e.g. restored from a
+        snapshot, which is continued
+        :param bound: optional FitnessBound of the plan
+        """
+        super().__init__(plan)
+        compiled = compile_plan(plan)
+        if recorded is not None:
+            self.finish = list(recorded.finish)
+            self.claims = list(recorded.claims)
+            self.size = recorded.size
+        self.l1 = l1
+        self.l2 = l2
+        self.cutoff = cutoff
+        self.deadline = compiled.DEADLINE.tolist()
+        # Number of times every product is in the sequence and its number of machines that are not released yet
+        self.count = [0] * len(self.finish)
+        for p in sequence:
+            self.count[p] += 1
+        self.remaining = [self.count[p] * compiled.NR_CLAIMS[p].item() - self.claims[p] for p in range(len(self.count))]
+
+        # Lower bound on the finish time of every product, the one of the simulation counts from the first release
+        lowest = [-math.inf] * len(self.finish)
+        self.makespan_bound = -math.inf
+        self.tardiness_bound = 0
+        if bound is not None:
+            finish, self.makespan_bound, self.tardiness_bound = bound.finish_bounds(sequence)
+            for p, finish_p in zip(sequence, finish.tolist()):
+                lowest[p] = finish_p if lowest[p] == -math.inf else min(lowest[p], finish_p)
+
+        # The tardiness of the finished products and the tardiness bound of the products that are not finished yet.
+        # The bound of a product increases with now once now is past both its deadline and its finish bound. The
+        # products before position due are past it, of those nr_due are not finished yet.
+        self.tardiness = 0
+        self.threshold = [max(lowest[p], self.deadline[p]) for p in range(len(self.count))]
+        pending = []
+        for p in range(len(self.count)):
+            if self.remaining[p] > 0:
+                pending.append(p)
+                self.tardiness += self.count[p] * max(0, lowest[p] - self.deadline[p])
+            elif self.count[p] > 0 and self.claims[p] > 0:
+                self.tardiness += self.count[p] * max(0, self.finish[p] - self.deadline[p])
+        self.lowest = lowest
+        self.pending = sorted(pending, key=lambda p: self.threshold[p])
+        self.due = 0
+        self.nr_due = 0
+        self.due_deadlines = 0
+
+    def record(self, activity, product, resource, check_resource_type, machine_id, request, retrieve, start, finish):
+        if finish > self.finish[product]:
+            self.finish[product] = finish
+        self.claims[product] += 1
+        self.size += 1
+
+        deadline = self.deadline
+        while self.due < len(self.pending) and self.threshold[self.pending[self.due]] < finish:
+            p = self.pending[self.due]
+            if self.remaining[p] > 0:
+                # From now on the bound of p is now minus its deadline
+                count = self.count[p]
+                self.tardiness -= count * max(0, self.lowest[p] - deadline[p])
+                self.nr_due += count
+                self.due_deadlines += count * deadline[p]
+            self.due += 1
+        self.remaining[product] -= 1
+        if self.remaining[product] == 0:
+            count = self.count[product]
+            if self.threshold[product] < finish:
+                self.nr_due -= count
+                self.due_deadlines -= count * deadline[product]
+            else:
+                self.tardiness -= count * max(0, self.lowest[product] - deadline[product])
+            self.tardiness += count * max(0, self.finish[product] - deadline[product])
+
+        makespan = max(finish, self.makespan_bound)
+        tardiness = max(self.tardiness + self.nr_due * finish - self.due_deadlines, self.tardiness_bound)
+        if self.l1 * makespan + self.l2 * tardiness >= self.cutoff:
+            raise CutoffReached(makespan, tardiness)
@@ -0,0 +1,79 @@
+import time
+
+
+class SimulationStats:
+    """
+    Opt-in profile of simulations: the wall time per phase, the number of processed events, the number of machines
+    that are requested from (get) and put back into the factory and the largest number of requests that wait for a
+    machine at the same time. Pass it as simulate(..., stats=stats) or evaluator_simpy(..., stats=stats); the numbers
+    of all simulations that get the same object are added up (the peak is the maximum). Without stats the simulators
+    do not measure anything. The phases are:
+        environment: creating the environment, the event calendar and the resource usage recorder
+        store: creating the machines of the factory (part of environment for simulator_3_fast)
+        run: processing the events
+        results: computing the makespan and tardiness and writing the resource usage
+    """
+    PHASES = ["environment", "store", "run", "results"]
+
+    def __init__(self):
+        self.nr_simulations = 0
+        self.time = dict.fromkeys(self.PHASES, 0.0)
+        self.nr_events = 0
+        self.nr_gets = 0
+        self.nr_puts = 0
+        self.peak_waiting = 0
+        self._last = None
+
+    def start(self):
+        """
+        Start the clock of the first phase of a simulation
+        """
+        self.nr_simulations += 1
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Add the time since the previous lap (or start) to phase
+        """
+        now = time.perf_counter()
+        self.time[phase] += now - self._last
+        self._last = now
+
+    def count(self, nr_events, nr_gets, nr_puts, peak_waiting):
+        self.nr_events += nr_events
+        self.nr_gets += nr_gets
+        self.nr_puts += nr_puts
+        self.peak_waiting = max(self.peak_waiting, peak_waiting)
+
+    def add(self, other):
+        """
+        Add the numbers of other, e.g. collected in another process
+        """
+        self.nr_simulations += other.nr_simulations
+        for phase in self.PHASES:
+            self.time[phase] += other.time[phase]
+        self.count(other.nr_events, other.nr_gets, other.nr_puts, other.peak_waiting)
+        return self
+
+    def __add__(self, other):
+        return SimulationStats().add(self).add(other)
+
+    @property
+    def total_time(self):
+        return sum(self.time.values())
+
+    def as_dict(self):
+        """
+        :return: flat dict of the numbers, e.g. for a row of a DataFrame
+        """
+        stats = {"nr_simulations": self.nr_simulations}
+        for phase in self.PHASES:
+            stats[f"time_{phase}"] = self.time[phase]
+        stats.update({"nr_events": self.nr_events, "nr_gets": self.nr_gets, "nr_puts": self.nr_puts,
+                      "peak_waiting": self.peak_waiting})
+        return stats
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase} {self.time[phase]:.3f}s" for phase in self.PHASES)
+        return (f'SimulationStats({self.nr_simulations} simulations, {phases}, {self.nr_events} events, '
+                f'{self.nr_gets} gets, {self.nr_puts} puts, peak of {self.peak_waiting} waiting requests)')
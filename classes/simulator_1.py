@@ -1,8 +1,9 @@
-import copy
 import simpy
 import random
-import pandas as pd
-from collections import namedtuple
+import numpy as np
+from classes.compiled_plan import compile_plan
+from classes.machine_pool import MachinePool, ProfiledMachinePool
+from classes.resource_usage import CutoffFinishTimes, CutoffReached, FinishTimes, ResourceUsage, ResourceUsageWriter
 
 
 class Simulator:
@@ -13,11 +14,13 @@ class Simulator:
         self.CAPACITY = plan.FACTORY.CAPACITY
         self.RESOURCES = []
         self.env = simpy.Environment()
-        self.resource_usage = []
+        self.resource_usage = None
+        self.durations = None
+        self.compiled = None
         self.printing = printing
 
     def resource_request(self, product, resource_group):
-        resource = yield self.factory.get(lambda resource: resource.resource_group == resource_group)
+        resource = yield self.factory.get(resource_group)
         if self.printing:
             print(product, 'requested', resource.resource_group, ' id ', resource.id, 'at', self.env.now)
         return resource
@@ -27,26 +30,22 @@ class Simulator:
         #TODO: adjust such that machines in the store are requested instead of resources
 
         # FIRST DO THE REQUESTING
-        activities = self.plan.PRODUCTS[p].ACTIVITIES
+        activities = self.compiled.ACTIVITIES[p]
         durations = []
         resources_required = {}
         resources_names = {}
         for i in range(0, len(activities)):
             activity = activities[i]
-            needs = activity.NEEDS
-            duration = random.randint(*activity.PROCESSING_TIME)
+            if self.durations is None:
+                duration = random.randint(activity.low, activity.high)
+            else:
+                duration = self.durations[p][i]
             durations.append(duration)
             resources_required_act = []
-            resources_names_act = []
-            for r in range(0, self.NR_RESOURCES):
-                need = needs[r]
-                if need > 0:
-                    for _ in range(0, need):
-                        resource_name = self.RESOURCE_NAMES[r]
-                        resources_required_act.append(self.env.process(self.resource_request(product=p, resource_group=resource_name)))
-                        resources_names_act.append(resource_name)
+            for resource_name in activity.names:
+                resources_required_act.append(self.env.process(self.resource_request(product=p, resource_group=resource_name)))
             resources_required[i] = resources_required_act
-            resources_names[i] = resources_names_act
+            resources_names[i] = activity.names
         request_time = self.env.now
         if self.printing:
             print(f'Product {p} requested resources: {resources_names} at time: {request_time}')
@@ -58,10 +57,7 @@ class Simulator:
                 print(f'Product {p}, activity {i}, retrieved resources: {resources_names[i]} at time: {retrieve_time}')
 
         for i in range(0, len(activities)):
-            if i == 0:
-                delay_factor = 0
-            else:
-                delay_factor = self.plan.PRODUCTS[p].TEMPORAL_RELATIONS[(0, i)]
+            delay_factor = activities[i].delay
             self.env.process(self.activity_processing(i=i, p=p, delay=delay_factor, duration=durations[i], resources_required=resources_required[i],
                                                       resources_names=resources_names[i], request_time=request_time,
                                                       retrieve_time=retrieve_time))
@@ -83,15 +79,9 @@ class Simulator:
             if self.printing:
                 print(f'Product {p} released resources: {resource_name} at time: {end_time}')
 
-            self.resource_usage.append({"Activity": i,
-                                        "Product": p,
-                                        "Resource": resource_name,
-                                        "Check_resource_type": r.resource_group,
-                                        "Machine_id": r.id,
-                                        "Request moment": request_time,
-                                        "Retrieve moment": retrieve_time,
-                                        "Start": start_time,
-                                        "Finish": end_time})
+            self.resource_usage.record(activity=i, product=p, resource=resource_name,
+                                       check_resource_type=r.resource_group, machine_id=r.id, request=request_time,
+                                       retrieve=retrieve_time, start=start_time, finish=end_time)
 
     def product_generator(self):
         """Generate activities that arrive at the factory. For certain activities there are temporal relations,
@@ -105,45 +95,88 @@ class Simulator:
             priority += 1
             yield self.env.timeout(3)
 
-    def simulate(self, SIM_TIME, RANDOM_SEED, write=False, output_location="Results.csv"):
+    def simulate(self, SIM_TIME, RANDOM_SEED, write=False, output_location="Results.csv", metrics_only=False,
+                 durations=None, stats=None, chunk_size=None, cutoff=None, l1=1, l2=1,
+                 bound=None):
+        """
+        :param metrics_only: only keep track of the finish time per product, which suffices for the makespan and the
+        tardiness, instead of recording the resource usage
+        :param durations: optional matrix of sample_durations in classes/general.py with the duration of activity i of
+        product p at [p, i], which is used instead of drawing the durations during the simulation
+        :param stats: optional SimulationStats of classes/simulation_stats.py, to which the wall time per phase and the
+        event counts of this simulation are added
+        :param chunk_size: with write, the resource usage is written to output_location in chunks of chunk_size rows
+        during the simulation, instead of at the end. output_location is a CSV file if it ends with .csv and a
+        directory of columns otherwise, see load_resource_usage in classes/resource_usage.py.
+        :param cutoff: with metrics_only, the simulation is stopped as soon as l1 * makespan + l2 * tardiness is known
+        to be at least cutoff, see CutoffFinishTimes in classes/resource_usage.py. Then cutoff_reached is True and
+        lower bounds on the makespan and the tardiness are returned.
+        :param bound: optional FitnessBound of classes/lower_bound.py for the plan, with which the cutoff is reached
+        sooner
+        """
+        if write and metrics_only:
+            raise ValueError("The resource usage is not recorded with metrics_only, so it cannot be written")
+        if cutoff is not None and not metrics_only:
+            raise ValueError("A cutoff is only supported with metrics_only")
         if self.printing:
             print(f'START Factory simulation for seed {RANDOM_SEED}')
+        if stats is not None:
+            stats.start()
         random.seed(RANDOM_SEED)
+        self.durations = None if durations is None else durations.tolist()
+        self.compiled = compile_plan(self.plan)
         # Reset environment
         self.env = simpy.Environment()
-        self.resource_usage = []
-
-        # TO DO: REPLACE WITH FACTORY STORE TYPE
-        self.factory = simpy.FilterStore(self.env, capacity=sum(self.CAPACITY))
-        Resource = namedtuple('Machine', 'resource_group, id')
-        items = []
-        for r in range(0, self.NR_RESOURCES):
-            for j in range(0, self.CAPACITY[r]):
-                resource = Resource(self.RESOURCE_NAMES[r], j)
-                items.append(copy.copy(resource))
-        self.factory.items = items
+        if cutoff is not None:
+            self.resource_usage = CutoffFinishTimes(self.plan, self.plan.SEQUENCE, l1, l2, cutoff, bound=bound)
+        elif metrics_only:
+            self.resource_usage = FinishTimes(self.plan)
+        elif write and chunk_size is not None:
+            self.resource_usage = ResourceUsageWriter(self.plan, output_location, self.plan.SEQUENCE, chunk_size)
+        else:
+            self.resource_usage = ResourceUsage(self.plan, self.plan.SEQUENCE)
+
+        if stats is None:
+            self.factory = MachinePool(self.env, self.RESOURCE_NAMES, self.CAPACITY)
+        else:
+            stats.lap("environment")
+            self.factory = ProfiledMachinePool(self.env, self.RESOURCE_NAMES, self.CAPACITY)
+            stats.lap("store")
         self.env.process(self.product_generator())
 
         # Execute!
-        self.env.run(until=SIM_TIME)
+        self.cutoff_reached = False
+        try:
+            self.env.run(until=SIM_TIME)
+        except CutoffReached as reached:
+            self.cutoff_reached = True
+            bounds = reached.makespan, reached.tardiness
+        if stats is not None:
+            stats.lap("run")
+            # Every scheduled event got the next id of the environment, the ones left in its queue are not processed
+            nr_events = next(self.env._eid) - len(self.env._queue)
+            stats.count(nr_events, self.factory.nr_requests, self.factory.nr_puts, self.factory.peak_waiting)
+
+        if self.cutoff_reached:
+            if self.printing:
+                print(f"The simulation is stopped at the cutoff {cutoff}")
+            return bounds
 
         # Process results
-        self.resource_usage = pd.DataFrame(self.resource_usage)
-        makespan = max(self.resource_usage["Finish"])
-        tardiness = 0
-
-        for p in self.plan.SEQUENCE:
-            schedule = self.resource_usage[self.resource_usage["Product"] == p]
-            finish = max(schedule["Finish"])
-            if self.printing:
-                print(f'Product {p} finished at time {finish}, while the deadline was {self.plan.PRODUCTS[p].DEADLINE}.')
-            tardiness += max(0, finish - self.plan.PRODUCTS[p].DEADLINE)
+        finish = self.resource_usage.product_finish(self.plan.SEQUENCE)
+        makespan = finish.max().item()
+        deadlines = self.compiled.DEADLINE[self.plan.SEQUENCE]
+        tardiness = np.maximum(0, finish - deadlines).sum().item()
 
         if self.printing:
+            for p, finish_p, deadline in zip(self.plan.SEQUENCE, finish, deadlines):
+                print(f'Product {p} finished at time {finish_p}, while the deadline was {deadline}.')
             print(f"The makespan corresponding to this schedule is {makespan}")
             print(f"The tardiness corresponding to this schedule is {tardiness}")
         if write:
-            self.resource_usage.to_csv(output_location)
+            self.resource_usage.write(output_location)
+        if stats is not None:
+            stats.lap("results")
 
         return makespan, tardiness
 
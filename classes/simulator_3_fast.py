@@ -0,0 +1,830 @@
+import copy
+import heapq
+import random
+import sys
+import numpy as np
+from classes.compiled_plan import compile_plan
+from classes.factory_state import ActivityState, FactoryState, ProductState
+from classes.resource_usage import CutoffFinishTimes, CutoffReached, FinishTimes, ResourceUsage, ResourceUsageWriter
+from collections import OrderedDict, deque
+
+# Event priorities, identical to the ones used by the SimPy kernel
+URGENT = 0
+NORMAL = 1
+
+# Event kinds of the calendar, each one corresponds to the resumption of a SimPy process in classes/simulator_3.py
+GENERATE = 0        # product_generator releases the next product of the sequence
+PRODUCT = 1         # product process starts and requests the resources of the first activity
+REQUEST = 2         # resource_request process starts and claims a machine from the factory
+RETRIEVED = 3       # claim of a machine is granted
+REQUEST_DONE = 4    # resource_request process terminates
+ALL_OF = 5          # all machines of an activity are claimed
+TICK = 6            # product process releases the next downstream activity
+ACTIVITY = 7        # activity_processing process starts
+DELAY = 8           # temporal relation of an activity has passed
+FINISH = 9          # processing of an activity is finished
+RELEASED = 10       # machine is put back into the factory
+
+
+class Simulator:
+    """
+    SimPy-free implementation of classes/simulator_3.Simulator. The SimPy processes are replaced by a heap-based event
+    calendar that orders events on (time, priority, event id) exactly as SimPy does, and the FilterStore is replaced by
+    array-backed machine state with a free list and a FIFO waiting queue per resource group. Because events are
+    processed in the same order, the random durations, the machine ids and the resource usage rows are identical to
+    the ones of simulator_3.
+    """
+    def __init__(self, plan, printing=False):
+        self.plan = plan
+        self.RESOURCE_NAMES = plan.FACTORY.RESOURCE_NAMES
+        self.NR_RESOURCES = len(self.RESOURCE_NAMES)
+        self.CAPACITY = plan.FACTORY.CAPACITY
+        self.resource_usage = None
+        self.durations = None
+        self.compiled = None
+        self.printing = printing
+        self.now = 0
+
+    def _reset(self):
+        """
+        Initialize the event calendar, the machine state and the activity administration
+        """
+        self.now = 0
+        self._queue = []
+        self._eid = 0
+
+        # Machine state: free machine ids and waiting requests per resource group
+        self.free = [deque(range(0, self.CAPACITY[r])) for r in range(0, self.NR_RESOURCES)]
+        self.waiting = [deque() for _ in range(0, self.NR_RESOURCES)]
+        self.dirty = []
+
+        # Requests: resource group, claimed machine, whether the request process has terminated and its activity
+        self.request_group = []
+        self.request_machine = []
+        self.request_done = []
+        self.request_activity = []
+
+        # Activities are numbered as in the CompiledPlan, product p has activities ACTIVITY_OFFSET[p], ...,
+        # ACTIVITY_OFFSET[p + 1] - 1
+        self.ACTIVITY_OFFSET = self.compiled.ACTIVITY_OFFSET.tolist()
+        self.activity_product = self.compiled.ACTIVITY_PRODUCT.tolist()
+        self.activity_index = self.compiled.ACTIVITY_INDEX.tolist()
+        nr_activities = self.ACTIVITY_OFFSET[-1]
+        self.activity_duration = [0] * nr_activities
+        self.activity_requests = [None] * nr_activities
+        self.activity_pending = [-1] * nr_activities
+        # Start of the processing, None while an activity has not started
+        self.activity_retrieve = [None] * nr_activities
+        self.request_time = [0] * self.compiled.NR_PRODUCTS
+
+    def _schedule(self, delay, priority, kind, arg):
+        heapq.heappush(self._queue, (self.now + delay, priority, self._eid, kind, arg))
+        self._eid += 1
+
+    def _request_resources(self, a):
+        """
+        Draw the duration of activity a and start one request for every machine that it needs
+        """
+        activity = self.compiled.ACTIVITY_RECORDS[a]
+        if self.durations is None:
+            self.activity_duration[a] = random.randint(activity.low, activity.high)
+        else:
+            self.activity_duration[a] = self.durations[activity.product][activity.index]
+        requests = []
+        for r in activity.groups:
+            request = len(self.request_group)
+            self.request_group.append(r)
+            self.request_machine.append(-1)
+            self.request_done.append(False)
+            self.request_activity.append(a)
+            requests.append(request)
+            self._schedule(0, URGENT, REQUEST, request)
+        self.activity_requests[a] = requests
+
+    def _add_request(self, r, machine, a):
+        """
+        Administration of a request of activity a for resource group r, which has claimed machine or -1
+        """
+        request = len(self.request_group)
+        self.request_group.append(r)
+        self.request_machine.append(machine)
+        self.request_done.append(machine != -1)
+        self.request_activity.append(a)
+        return request
+
+    def _all_of(self, a):
+        """
+        Wait for the termination of all requests of activity a, which is the equivalent of env.all_of
+        """
+        pending = 0
+        for request in self.activity_requests[a]:
+            if not self.request_done[request]:
+                pending += 1
+        self.activity_pending[a] = pending
+        if pending == 0:
+            self._schedule(0, NORMAL, ALL_OF, a)
+
+    def _trigger_get(self):
+        """
+        Hand out free machines to the waiting requests. Only resource groups with both free machines and waiting
+        requests are considered, and their requests are served in the order in which they were made.
+        """
+        if not self.dirty:
+            return
+        served = []
+        for r in self.dirty:
+            free = self.free[r]
+            waiting = self.waiting[r]
+            while free and waiting:
+                request = waiting.popleft()
+                self.request_machine[request] = free.popleft()
+                served.append(request)
+        self.dirty = []
+        if len(served) > 1:
+            served.sort()
+        for request in served:
+            self._schedule(0, NORMAL, RETRIEVED, request)
+
+    def _trigger_get_profiled(self):
+        Simulator._trigger_get(self)
+        waiting = sum(len(requests) for requests in self.waiting)
+        if waiting > self._peak_waiting:
+            self._peak_waiting = waiting
+
+    def _begin_profile(self):
+        """
+        Count the events, requests and releases from here on and the peak of waiting requests, for SimulationStats.
+        _trigger_get is only replaced on this instance, such that a simulation without stats does not pay for it.
+        """
+        self._profile = (self._eid - len(self._queue), len(self.request_group), len(self.resource_usage))
+        self._peak_waiting = sum(len(requests) for requests in self.waiting)
+        self._trigger_get = self._trigger_get_profiled
+
+    def _end_profile(self, stats):
+        nr_events, nr_gets, nr_puts = self._profile
+        # Every scheduled event got the next id, the ones left in the calendar are not processed
+        stats.count(self._eid - len(self._queue) - nr_events, len(self.request_group) - nr_gets,
+                    len(self.resource_usage) - nr_puts, self._peak_waiting)
+        del self._trigger_get
+
+    def _release(self, request):
+        """
+        Put the machine claimed by request back into the factory
+        """
+        r = self.request_group[request]
+        self.free[r].append(self.request_machine[request])
+        if self.waiting[r] and r not in self.dirty:
+            self.dirty.append(r)
+        self._schedule(0, NORMAL, RELEASED, request)
+
+    def _run(self, SIM_TIME, release_limit=None):
+        """
+        Process the events before SIM_TIME. With release_limit, stop right before product release_limit of the
+        sequence is released.
+        """
+        queue = self._queue
+        heappop = heapq.heappop
+        records = self.compiled.ACTIVITY_RECORDS
+        sequence = self.plan.SEQUENCE
+        activity_product = self.activity_product
+        activity_index = self.activity_index
+        activity_requests = self.activity_requests
+        activity_pending = self.activity_pending
+        request_activity = self.request_activity
+
+        while queue and queue[0][0] < SIM_TIME:
+            event = heappop(queue)
+            self.now, _, _, kind, arg = event
+
+            if kind == RELEASED:
+                self._trigger_get()
+                a = request_activity[arg]
+                p = activity_product[a]
+                r = self.request_group[arg]
+                if self.printing:
+                    print(f'Product {p} released resources: {self.RESOURCE_NAMES[r]} at time: {self.now}')
+                self.resource_usage.record(activity=activity_index[a], product=p, resource=self.RESOURCE_NAMES[r],
+                                           check_resource_type=self.RESOURCE_NAMES[r],
+                                           machine_id=self.request_machine[arg], request=self.request_time[p],
+                                           retrieve=self.activity_retrieve[a], start=self.activity_retrieve[a],
+                                           finish=self.now)
+                requests = activity_requests[a]
+                j = requests.index(arg) + 1
+                if j < len(requests):
+                    self._release(requests[j])
+
+            elif kind == REQUEST:
+                r = self.request_group[arg]
+                self.waiting[r].append(arg)
+                if self.free[r] and r not in self.dirty:
+                    self.dirty.append(r)
+                self._trigger_get()
+
+            elif kind == RETRIEVED:
+                if self.printing:
+                    print(activity_product[request_activity[arg]], 'requested', self.RESOURCE_NAMES[self.request_group[arg]],
+                          ' id ', self.request_machine[arg], 'at', self.now)
+                self._schedule(0, NORMAL, REQUEST_DONE, arg)
+
+            elif kind == REQUEST_DONE:
+                self.request_done[arg] = True
+                a = request_activity[arg]
+                if activity_pending[a] > 0:
+                    activity_pending[a] -= 1
+                    if activity_pending[a] == 0:
+                        self._schedule(0, NORMAL, ALL_OF, a)
+
+            elif kind == ALL_OF:
+                if activity_index[arg] == 0:
+                    # The first activity has claimed its machines: release it and request all downstream resources
+                    p = activity_product[arg]
+                    self._schedule(0, URGENT, ACTIVITY, arg)
+                    last = self.ACTIVITY_OFFSET[p + 1]
+                    for a in range(arg + 1, last):
+                        self._request_resources(a)
+                    if arg + 1 < last:
+                        self._schedule(0, NORMAL, TICK, arg + 1)
+                else:
+                    self._start(arg)
+
+            elif kind == TICK:
+                self._schedule(0, URGENT, ACTIVITY, arg)
+                p = activity_product[arg]
+                if arg + 1 < self.ACTIVITY_OFFSET[p + 1]:
+                    self._schedule(0, NORMAL, TICK, arg + 1)
+
+            elif kind == ACTIVITY:
+                i = activity_index[arg]
+                if i > 0:
+                    self._schedule(records[arg].delay, NORMAL, DELAY, arg)
+                else:
+                    self._schedule(0, NORMAL, DELAY, arg)
+
+            elif kind == DELAY:
+                if activity_index[arg] > 0:
+                    self._all_of(arg)
+                else:
+                    if self.printing:
+                        p = activity_product[arg]
+                        print(f'request time {p} 0 is {self.request_time[p]}')
+                    self._start(arg)
+
+            elif kind == FINISH:
+                self._release(activity_requests[arg][0])
+
+            elif kind == PRODUCT:
+                a = self.ACTIVITY_OFFSET[arg]
+                self._request_resources(a)
+                self.request_time[arg] = self.now
+                self._all_of(a)
+
+            elif kind == GENERATE:
+                if arg == release_limit:
+                    heapq.heappush(queue, event)
+                    break
+                self._schedule(0, URGENT, PRODUCT, sequence[arg])
+                if arg + 1 < len(sequence) or arg + 1 == release_limit:
+                    self._schedule(3, NORMAL, GENERATE, arg + 1)
+
+    def _start(self, a):
+        """
+        All machines of activity a are claimed, start processing
+        """
+        self.activity_retrieve[a] = self.now
+        if self.printing:
+            names = [self.RESOURCE_NAMES[self.request_group[request]] for request in self.activity_requests[a]]
+            print(f'Product {self.activity_product[a]}, activity {self.activity_index[a]}, retrieved resources: '
+                  f'{names} at time: {self.now}')
+        if self.activity_requests[a]:
+            self._schedule(self.activity_duration[a], NORMAL, FINISH, a)
+
+    def _initialize(self, RANDOM_SEED, metrics_only, release_limit=None, durations=None, resource_usage=None,
+                    state=None):
+        self.plan.SEQUENCE = [int(i) for i in self.plan.SEQUENCE]
+        if self.printing:
+            print(f'START Factory simulation for seed {RANDOM_SEED}')
+        random.seed(RANDOM_SEED)
+        self.durations = None if durations is None else durations.tolist()
+        self.compiled = compile_plan(self.plan)
+        # Products of which the makespan and the tardiness are computed
+        self.products = self.plan.SEQUENCE if state is None else [int(p) for p in state.released] + self.plan.SEQUENCE
+        # Reset calendar and factory
+        if resource_usage is not None:
+            self.resource_usage = resource_usage
+        elif metrics_only:
+            self.resource_usage = FinishTimes(self.plan)
+        else:
+            self.resource_usage = ResourceUsage(self.plan, self.products)
+        self._reset()
+        if state is not None:
+            self._load_state(state)
+        elif self.plan.SEQUENCE or release_limit == 0:
+            self._schedule(0, URGENT, GENERATE, 0)
+
+    def _load_state(self, state):
+        """
+        Continue from a FactoryState: set the clock to state.now, claim the machines of the products in the state,
+        record their finished activities, put their waiting requests in the queues and schedule the events that are
+        still to come, i.e. the end of the processing activities, the end of the delays of the downstream activities
+        and the release of the first product of plan.SEQUENCE at state.next_release. Events at the same time are
+        scheduled in the order of state.events, or else in the order in which the simulation would have scheduled
+        them, as far as it follows from the state.
+        """
+        self.now = now = state.now
+        records = self.compiled.ACTIVITY_RECORDS
+        claimed = [set() for _ in range(0, self.NR_RESOURCES)]
+        finished = []
+        # Events as (time of scheduling, position in the state, time, priority, kind, activity) and waiting requests
+        # as (request time, position in the state, activity, position in the activity)
+        events = []
+        queued = []
+        for order, product_state in enumerate(state.products):
+            p = int(product_state.product)
+            offset, last = self.ACTIVITY_OFFSET[p], self.ACTIVITY_OFFSET[p + 1]
+            if self.activity_requests[offset] is not None:
+                raise ValueError(f"Product {p} is in the state more than once")
+            if len(product_state.activities) > last - offset:
+                raise ValueError(f"Product {p} has {last - offset} activities, the state has "
+                                 f"{len(product_state.activities)}")
+            if product_state.release > now:
+                raise ValueError(f"Product {p} is released at {product_state.release}, after the current time {now}")
+            self.request_time[p] = product_state.release
+            activities = product_state.activities + [ActivityState()] * (last - offset - len(product_state.activities))
+            first = activities[0].start
+
+            for a, activity_state in zip(range(offset, last), activities):
+                i = self.activity_index[a]
+                record = records[a]
+                machines = activity_state.machines or [None] * len(record.groups)
+                if len(machines) != len(record.groups):
+                    raise ValueError(f"Activity {i} of product {p} claims {len(record.groups)} machines, the state has "
+                                     f"{len(machines)}")
+                if i > 0 and first is None:
+                    if activity_state.start is not None or any(m is not None for m in machines):
+                        raise ValueError(f"Activity {i} of product {p} has machines or has started, while its first "
+                                         f"activity has not started")
+                    continue
+                started = activity_state.start is not None
+                if started and (activity_state.finish is None or None in machines):
+                    raise ValueError(f"Activity {i} of product {p} has started, it needs a finish and all its machines")
+
+                # Requests of the activity, the machines of a finished activity are back in the factory. The waiting
+                # requests are made after all claims, in the order of the get queue.
+                requests = []
+                for k, (r, m) in enumerate(zip(record.groups, machines)):
+                    if m is None:
+                        requests.append(None)
+                        queued.append((product_state.release if i == 0 else first, order, a, k))
+                        continue
+                    requests.append(self._add_request(r, int(m), a))
+                    if not started or activity_state.finish >= now:
+                        if not 0 <= m < self.CAPACITY[r] or m in claimed[r]:
+                            raise ValueError(f"Machine {m} of {self.RESOURCE_NAMES[r]} does not exist or is claimed "
+                                             f"twice")
+                        claimed[r].add(m)
+                self.activity_requests[a] = requests
+
+                if started:
+                    self.activity_retrieve[a] = activity_state.start
+                    self.activity_duration[a] = activity_state.finish - activity_state.start
+                    if activity_state.finish < now:
+                        finished.append((activity_state.finish, a))
+                    else:
+                        events.append((activity_state.start, order, activity_state.finish, NORMAL, FINISH, a))
+                    continue
+                if activity_state.duration is not None:
+                    self.activity_duration[a] = activity_state.duration
+                elif self.durations is None:
+                    self.activity_duration[a] = random.randint(record.low, record.high)
+                else:
+                    self.activity_duration[a] = self.durations[p][i]
+                pending = machines.count(None)
+                if i > 0 and first + record.delay >= now:
+                    # The delay after the start of the first activity has not passed, the claims are counted then
+                    events.append((first, order, first + record.delay, NORMAL, DELAY, a))
+                elif pending == 0:
+                    events.append((now, order, now, NORMAL, ALL_OF, a))
+                else:
+                    self.activity_pending[a] = pending
+
+        # The finished activities are recorded in the order of their finish
+        for finish, a in sorted(finished):
+            p = self.activity_product[a]
+            for request in self.activity_requests[a]:
+                name = self.RESOURCE_NAMES[self.request_group[request]]
+                self.resource_usage.record(activity=self.activity_index[a], product=p, resource=name,
+                                           check_resource_type=name, machine_id=self.request_machine[request],
+                                           request=self.request_time[p], retrieve=self.activity_retrieve[a],
+                                           start=self.activity_retrieve[a], finish=finish)
+
+        for name in state.free:
+            if name not in self.RESOURCE_NAMES:
+                raise ValueError(f"The state has free machines of {name}, which is not a resource group of the factory")
+        for r, name in enumerate(self.RESOURCE_NAMES):
+            unclaimed = [m for m in range(0, self.CAPACITY[r]) if m not in claimed[r]]
+            if name in state.free:
+                if sorted(state.free[name]) != unclaimed:
+                    raise ValueError(f"The free machines of {name} are {sorted(state.free[name])}, the machines that "
+                                     f"are not claimed are {unclaimed}")
+                self.free[r] = deque(int(m) for m in state.free[name])
+            else:
+                self.free[r] = deque(unclaimed)
+        queued.sort()
+        if state.waiting is not None:
+            # The requests of an activity are made in the order of its resources
+            requests = {}
+            for _, _, a, k in queued:
+                requests.setdefault(self._activity_key(a), deque()).append((a, k))
+            order = [(int(p), int(i)) for p, i in state.waiting]
+            if sorted(order) != sorted(key for key, queue in requests.items() for _ in queue):
+                raise ValueError(f"The waiting requests of the state are {sorted(order)}, the activities that wait are "
+                                 f"{sorted(requests)}")
+            queued = [(None, None) + requests[key].popleft() for key in order]
+        for _, _, a, k in queued:
+            request = self._add_request(records[a].groups[k], -1, a)
+            self.activity_requests[a][k] = request
+            self.waiting[self.request_group[request]].append(request)
+
+        if self.plan.SEQUENCE:
+            events.append((state.next_release - 3, len(state.products), state.next_release, NORMAL, GENERATE, 0))
+        events.sort()
+        if state.events is not None:
+            keys = [None if event[4] == GENERATE else self._activity_key(event[5]) for event in events]
+            # Without products to release, the release of the state is left out
+            order = [None if event is None else (int(event[0]), int(event[1])) for event in state.events
+                     if event is not None or self.plan.SEQUENCE]
+            if len(order) != len(keys) or set(order) != set(keys):
+                raise ValueError(f"The events of the state are {order}, the events that follow from the state are "
+                                 f"{keys}")
+            position = {key: j for j, key in enumerate(order)}
+            events = [event for _, event in sorted(zip(keys, events), key=lambda pair: position[pair[0]])]
+        for _, _, time, priority, kind, arg in events:
+            self._schedule(time - now, priority, kind, arg)
+        # Machines that are free while requests of their resource group wait are handed out right away
+        self.dirty = [r for r in range(0, self.NR_RESOURCES) if self.free[r] and self.waiting[r]]
+        self._trigger_get()
+
+    def snapshot(self, SIM_TIME, RANDOM_SEED, nr_fixed, metrics_only=True, durations=None):
+        """
+        Simulate the first nr_fixed products of the sequence up to the moment that the next product is released. Up
+        to that moment the simulation does not depend on the rest of the sequence, so every sequence that starts with
+        the same products can resume from the returned Snapshot with simulate(..., snapshot=snapshot).
+        :param nr_fixed: number of products at the start of plan.SEQUENCE that are fixed
+        """
+        self._initialize(RANDOM_SEED, metrics_only, release_limit=nr_fixed, durations=durations)
+        self._run(SIM_TIME, release_limit=nr_fixed)
+        return Snapshot(self, RANDOM_SEED, nr_fixed)
+
+    def factory_state(self, until, RANDOM_SEED, durations=None, state=None):
+        """
+        Simulate plan.SEQUENCE up to time until and return the FactoryState of classes/factory_state.py at that moment,
+        with the events before until processed. It holds all products that are released by then, also the finished
+        ones, so the rest of the simulation follows from simulate(..., state=...) with the products of plan.SEQUENCE
+        that are not released yet. The waiting activities keep the durations that are drawn for them, and the state
+        holds the order of the free machines, the waiting requests and the pending events, such that events at the same
+        time are processed in the same order as in this simulation.
+        :param state: optional FactoryState to start from instead of time zero
+        """
+        self._initialize(RANDOM_SEED, metrics_only=True, durations=durations, state=state)
+        self._run(until)
+        next_release = None
+        nr_released = len(self.plan.SEQUENCE)
+        for time, _, _, kind, arg in self._queue:
+            if kind == GENERATE:
+                next_release, nr_released = time, arg
+        released = self.products[:len(self.products) - len(self.plan.SEQUENCE) + nr_released]
+
+        products = []
+        for p in released:
+            activities = []
+            for a in range(self.ACTIVITY_OFFSET[p], self.ACTIVITY_OFFSET[p + 1]):
+                requests = self.activity_requests[a]
+                if requests is None:
+                    break
+                machines = [None if self.request_machine[request] == -1 else self.request_machine[request]
+                            for request in requests]
+                start = self.activity_retrieve[a]
+                if start is None:
+                    activities.append(ActivityState(machines, duration=self.activity_duration[a]))
+                else:
+                    activities.append(ActivityState(machines, start, start + self.activity_duration[a]))
+            products.append(ProductState(p, self.request_time[p], activities))
+        free = {name: list(self.free[r]) for r, name in enumerate(self.RESOURCE_NAMES)}
+        # Only the end of a processing activity or of a delay and the next release can be pending at until
+        events = [None if kind == GENERATE else self._activity_key(arg)
+                  for _, _, _, kind, arg in sorted(self._queue, key=lambda event: event[2])]
+        # The requests are made in the order of their ids
+        waiting = [self._activity_key(self.request_activity[request])
+                   for request in sorted(request for requests in self.waiting for request in requests)]
+        return FactoryState(until, products, next_release=next_release, free=free, events=events, waiting=waiting)
+
+    def _activity_key(self, a):
+        """
+        :return: (product, activity) of activity a, as in a FactoryState
+        """
+        return self.activity_product[a], self.activity_index[a]
+
+    def simulate(self, SIM_TIME, RANDOM_SEED, write=False, output_location="Results.csv", metrics_only=False,
+                 snapshot=None, durations=None, stats=None, chunk_size=None, cutoff=None, l1=1, l2=1,
+                 bound=None, state=None):
+        """
+        :param metrics_only: only keep track of the finish time per product, which suffices for the makespan and the
+        tardiness, instead of recording the resource usage
+        :param durations: optional matrix of sample_durations in classes/general.py with the duration of activity i of
+        product p at [p, i], which is used instead of drawing the durations during the simulation
+        :param snapshot: Snapshot taken with the same seed for the first products of plan.SEQUENCE, the simulation
+        resumes from it instead of starting at time zero
+        :param stats: optional SimulationStats of classes/simulation_stats.py, to which the wall time per phase and the
+        event counts of this simulation are added
+        :param chunk_size: with write, the resource usage is written to output_location in chunks of chunk_size rows
+        during the simulation, instead of at the end. output_location is a CSV file if it ends with .csv and a
+        directory of columns otherwise, see load_resource_usage in classes/resource_usage.py.
+        :param cutoff: with metrics_only, the simulation is stopped as soon as l1 * makespan + l2 * tardiness is known
+        to be at least cutoff, see CutoffFinishTimes in classes/resource_usage.py. Then cutoff_reached is True and
+        lower bounds on the makespan and the tardiness are returned.
+        :param bound: optional FitnessBound of classes/lower_bound.py for the plan, with which the cutoff is reached
+        sooner
+        :param state: optional FactoryState of classes/factory_state.py, e.g. the current state of the factory, from
+        which the simulation continues instead of starting at time zero. Only the remaining work is simulated: the
+        activities of the products in the state that are not finished and the products of plan.SEQUENCE, which are
+        released from state.next_release on. The makespan and the tardiness are those of the products in the state
+        and plan.SEQUENCE together.
+        """
+        if write and metrics_only:
+            raise ValueError("The resource usage is not recorded with metrics_only, so it cannot be written")
+        if cutoff is not None and not metrics_only:
+            raise ValueError("A cutoff is only supported with metrics_only")
+        streaming = write and chunk_size is not None
+        if streaming and snapshot is not None:
+            raise ValueError("The rows before a snapshot are not streamed, so a resumed simulation cannot be streamed")
+        if state is not None and snapshot is not None:
+            raise ValueError("A simulation resumes from either a snapshot or a state")
+        if state is not None and bound is not None:
+            raise ValueError("The bounds of a FitnessBound hold for a simulation from time zero, not from a state")
+
+        if stats is not None:
+            stats.start()
+        if streaming:
+            products = self.plan.SEQUENCE if state is None else state.released + list(self.plan.SEQUENCE)
+            self._initialize(RANDOM_SEED, metrics_only, durations=durations, state=state,
+                             resource_usage=ResourceUsageWriter(self.plan, output_location, products, chunk_size))
+        elif snapshot is None:
+            self._initialize(RANDOM_SEED, metrics_only, durations=durations, state=state)
+        else:
+            self.plan.SEQUENCE = [int(i) for i in self.plan.SEQUENCE]
+            snapshot.restore(self, RANDOM_SEED, metrics_only, durations)
+        if cutoff is not None:
+            self.resource_usage = CutoffFinishTimes(self.plan, self.products, l1, l2, cutoff,
+                                                    recorded=self.resource_usage, bound=bound)
+
+        # Execute!
+        if stats is None:
+            self._run_to_cutoff(SIM_TIME)
+            return self._results(write, output_location)
+        stats.lap("environment")
+        self._begin_profile()
+        self._run_to_cutoff(SIM_TIME)
+        self._end_profile(stats)
+        stats.lap("run")
+        results = self._results(write, output_location)
+        stats.lap("results")
+        return results
+
+    def _run_to_cutoff(self, SIM_TIME):
+        """
+        Run the rest of the simulation, which is stopped early if a CutoffFinishTimes records the resource usage
+        """
+        self.cutoff_reached = False
+        try:
+            self._run(SIM_TIME)
+        except CutoffReached as reached:
+            self.cutoff_reached = True
+            self.bounds = reached.makespan, reached.tardiness
+
+    def _results(self, write, output_location):
+        """
+        Makespan and tardiness of the finished simulation, or the lower bounds on them if it is stopped at the cutoff
+        """
+        if self.cutoff_reached:
+            if self.printing:
+                print(f"The simulation is stopped at the cutoff {self.resource_usage.cutoff}")
+            return self.bounds
+        finish = self.resource_usage.product_finish(self.products)
+        makespan = finish.max().item()
+        deadlines = self.compiled.DEADLINE[self.products]
+        tardiness = np.maximum(0, finish - deadlines).sum().item()
+
+        if self.printing:
+            for p, finish_p, deadline in zip(self.products, finish, deadlines):
+                print(f'Product {p} finished at time {finish_p}, while the deadline was {deadline}.')
+            print(f"The makespan corresponding to this schedule is {makespan}")
+            print(f"The lateness corresponding to this schedule is {tardiness}")
+        if write:
+            self.resource_usage.write(output_location)
+
+        return makespan, tardiness
+
+
+class Snapshot:
+    """
+    State of a Simulator right before the release of product nr_fixed of the sequence: the clock, the event
+    calendar, the machines, the requests and activities in progress, the recorded usage and the state of the random
+    number generator.
+    """
+    # Administration that is extended or changed during the simulation, the rest only depends on the plan
+    LISTS = ["_queue", "dirty", "request_group", "request_machine", "request_done", "request_activity",
+             "activity_duration", "activity_requests", "activity_pending", "activity_retrieve", "request_time"]
+
+    def __init__(self, simulator, RANDOM_SEED, nr_fixed):
+        self.RANDOM_SEED = RANDOM_SEED
+        self.prefix = simulator.plan.SEQUENCE[:nr_fixed]
+        self.metrics_only = isinstance(simulator.resource_usage, FinishTimes)
+        self.random_state = random.getstate()
+        self.durations = simulator.durations
+        self.compiled = simulator.compiled
+        self.now = simulator.now
+        self.eid = simulator._eid
+        self.ACTIVITY_OFFSET = simulator.ACTIVITY_OFFSET
+        self.activity_product = simulator.activity_product
+        self.activity_index = simulator.activity_index
+        self.free = [deque(free) for free in simulator.free]
+        self.waiting = [deque(waiting) for waiting in simulator.waiting]
+        self.lists = {name: list(getattr(simulator, name)) for name in self.LISTS}
+        if self.metrics_only:
+            # Without the cutoff of a CutoffFinishTimes, which is set per simulation
+            self.resource_usage = simulator.resource_usage.copy()
+        else:
+            self.resource_usage = copy.deepcopy(simulator.resource_usage)
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory use of the copied state, the lists of the plan that are shared are not counted
+        """
+        size = sys.getsizeof(self.random_state[1]) + sum(sys.getsizeof(machines) for machines in self.free + self.waiting)
+        for values in self.lists.values():
+            size += sys.getsizeof(values)
+        size += sum(sys.getsizeof(event) for event in self.lists["_queue"])
+        size += sum(sys.getsizeof(requests) for requests in self.lists["activity_requests"] if requests is not None)
+        if isinstance(self.resource_usage, FinishTimes):
+            size += sys.getsizeof(self.resource_usage.finish) + sys.getsizeof(self.resource_usage.claims)
+        else:
+            size += sum(column.nbytes for column in vars(self.resource_usage).values() if isinstance(column, np.ndarray))
+        return size
+
+    def restore(self, simulator, RANDOM_SEED, metrics_only, durations=None):
+        """
+        Put a copy of the state into simulator, whose plan.SEQUENCE has to start with the fixed products
+        """
+        if RANDOM_SEED != self.RANDOM_SEED or metrics_only != self.metrics_only:
+            raise ValueError("The snapshot was taken with another seed or recording mode")
+        if (None if durations is None else durations.tolist()) != self.durations:
+            raise ValueError("The snapshot was taken with other durations")
+        if simulator.plan.SEQUENCE[:len(self.prefix)] != self.prefix:
+            raise ValueError("The sequence does not start with the products of the snapshot")
+        random.setstate(self.random_state)
+        simulator.products = simulator.plan.SEQUENCE
+        simulator.durations = self.durations
+        simulator.compiled = self.compiled
+        simulator.now = self.now
+        simulator._eid = self.eid
+        simulator.ACTIVITY_OFFSET = self.ACTIVITY_OFFSET
+        simulator.activity_product = self.activity_product
+        simulator.activity_index = self.activity_index
+        simulator.free = [deque(free) for free in self.free]
+        simulator.waiting = [deque(waiting) for waiting in self.waiting]
+        for name in self.LISTS:
+            setattr(simulator, name, list(self.lists[name]))
+        if self.metrics_only:
+            simulator.resource_usage = self.resource_usage.copy()
+        else:
+            simulator.resource_usage = copy.deepcopy(self.resource_usage)
+
+
+class _PrefixNode:
+    __slots__ = ["parent", "product", "children", "snapshot"]
+
+    def __init__(self, parent, product):
+        self.parent = parent
+        self.product = product
+        self.children = {}
+        self.snapshot = None
+
+
+class PrefixCache:
+    """
+    Bounded trie of Snapshots keyed by sequence prefix, for the evaluation of neighbourhoods in which the candidates
+    share their first products (insertion at position k or a swap of positions i1 < i2 leaves the products before k
+    or i1 unchanged). Every simulation resumes from the Snapshot of its longest cached prefix. A Snapshot is only
+    stored for a prefix that the candidate shares with the previous candidate, rounded down to a multiple of
+    interval, because taking a Snapshot costs about as much as simulating a few product releases. The least recently
+    used Snapshots are evicted once their total size exceeds max_bytes. The tries are kept per instance, seed and
+    durations; only metrics_only simulations are supported.
+    """
+    def __init__(self, max_bytes=256 * 2 ** 20, interval=10):
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.roots = {}
+        self.previous = {}
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.releases_skipped = 0
+        self.releases_simulated = 0
+
+    def _lookup(self, root, sequence):
+        """
+        :return: deepest node on the path of sequence that holds a Snapshot (or root) and its depth
+        """
+        node = best = root
+        depth = best_depth = 0
+        for p in sequence:
+            node = node.children.get(p)
+            if node is None:
+                break
+            depth += 1
+            if node.snapshot is not None:
+                best, best_depth = node, depth
+        return best, best_depth
+
+    def _store(self, node, snapshot):
+        node.snapshot = snapshot
+        self.entries[node] = snapshot.nbytes
+        self.nbytes += self.entries[node]
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            evicted, size = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+            evicted.snapshot = None
+            # Prune the branch up to the first node that is still in use
+            while evicted.parent is not None and not evicted.children and evicted.snapshot is None:
+                del evicted.parent.children[evicted.product]
+                evicted = evicted.parent
+
+    def simulate(self, simulator, SIM_TIME, RANDOM_SEED, durations=None, stats=None, cutoff=None, l1=1, l2=1,
+                 bound=None):
+        """
+        Same as simulator.simulate(SIM_TIME, RANDOM_SEED, metrics_only=True, durations=durations, stats=stats,
+        cutoff=cutoff, l1=l1, l2=l2, bound=bound), taking a Snapshot counts as run. The cutoff only applies after the
+        Snapshot is taken, such that the Snapshot is always complete.
+        :param simulator: Simulator of which plan.SEQUENCE is the candidate
+        """
+        if stats is not None:
+            stats.start()
+        sequence = simulator.plan.SEQUENCE = [int(i) for i in simulator.plan.SEQUENCE]
+        key = (simulator.plan.NAME, RANDOM_SEED, None if durations is None else durations.tobytes())
+        root = self.roots.setdefault(key, _PrefixNode(None, None))
+        node, depth = self._lookup(root, sequence)
+        if node.snapshot is None:
+            self.misses += 1
+            simulator._initialize(RANDOM_SEED, metrics_only=True, durations=durations)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(node)
+            node.snapshot.restore(simulator, RANDOM_SEED, metrics_only=True, durations=durations)
+        self.releases_skipped += depth
+        self.releases_simulated += len(sequence) - depth
+
+        # Length of the prefix shared with the previous candidate, the last product is never shared by a longer one
+        previous = self.previous.get(key, [])
+        shared = 0
+        for p, q in zip(sequence, previous):
+            if p != q:
+                break
+            shared += 1
+        nr_fixed = min(shared, len(sequence) - 1)
+        nr_fixed -= nr_fixed % self.interval
+        self.previous[key] = sequence
+
+        if stats is not None:
+            stats.lap("environment")
+            simulator._begin_profile()
+        if nr_fixed > depth:
+            simulator._run(SIM_TIME, release_limit=nr_fixed)
+            for p in sequence[depth:nr_fixed]:
+                child = node.children.get(p)
+                if child is None:
+                    child = node.children[p] = _PrefixNode(node, p)
+                node = child
+            self._store(node, Snapshot(simulator, RANDOM_SEED, nr_fixed))
+        if cutoff is not None:
+            simulator.resource_usage = CutoffFinishTimes(simulator.plan, sequence, l1, l2, cutoff,
+                                                         recorded=simulator.resource_usage, bound=bound)
+        simulator._run_to_cutoff(SIM_TIME)
+        if stats is None:
+            return simulator._results(write=False, output_location=None)
+        simulator._end_profile(stats)
+        stats.lap("run")
+        results = simulator._results(write=False, output_location=None)
+        stats.lap("results")
+        return results
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return (f'PrefixCache({self.hits} hits, {self.misses} misses, {len(self.entries)} snapshots of '
+                f'{self.nbytes / 2 ** 20:.1f} MB, {self.releases_skipped} of '
+                f'{self.releases_skipped + self.releases_simulated} product releases skipped)')
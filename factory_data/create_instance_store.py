@@ -0,0 +1,10 @@
+"""
+For running this script set working directory to ~/SimPyManufacturing
+"""
+
+from classes.instance_store import InstanceStore, convert_instances
+
+# Convert the pickled instances into the instance store that is read by load_plan
+convert_instances(pattern="factory_data/instances/instance_*.pkl", directory="factory_data/instance_store")
+store = InstanceStore("factory_data/instance_store")
+print(f'Instance store with {len(store)} plans and {len(store.factories)} factories saved to "{store.directory}"')
@@ -0,0 +1,111 @@
+import time
+import numpy as np
+import pandas as pd
+from classes.experiments import write_history
+from classes.general import history_fitness
+
+
+class AskTellOptimizer:
+    """
+    Base of the ask/tell versions of the methods, which leave the evaluation of the candidates to the caller, e.g. to
+    evaluate them in parallel or on other machines:
+        while not optimizer.done:
+            candidates = optimizer.ask()
+            optimizer.tell([f_eval(candidate) for candidate in candidates])
+    With the same seed, the candidates and the history are the same as those of the function of the method. A subclass
+    implements _search, a generator that yields the list of candidates of every step and receives their fitnesses.
+    """
+    COLUMNS = ["Sequence", "Fitness", "Best_sequence", "Best_fitness", "Time", "Screened", "Cut_off"]
+
+    def __init__(self, stop_criterium="Time", time_limit=200, budget=400):
+        self.stop_criterium = stop_criterium
+        self.time_limit = time_limit
+        self.budget = budget
+        self.start = None
+        self.best_sequence = None
+        self.best_fitness = None
+        # Fitness that a candidate of the last ask has to beat to be of use, or None if all fitnesses are needed. A
+        # lower bound that is at least the cutoff (e.g. of evaluator_simpy with cutoff) does as well as the fitness.
+        self.cutoff = None
+        self.nr_evaluations = 0
+        self.history = {column: [] for column in self.COLUMNS}
+        self.done = False
+        self._search_steps = self._search()
+        self._candidates = next(self._search_steps)
+
+    def _search(self):
+        raise NotImplementedError
+
+    def ask(self):
+        """
+        :return: list of the candidate sequences to evaluate, the same until they are told. It is empty once the
+        search is done.
+        """
+        return list(self._candidates)
+
+    def tell(self, fitnesses):
+        """
+        :param fitnesses: fitnesses of the candidates of the last ask, in the same order
+        """
+        fitnesses = list(fitnesses)
+        if self.done:
+            raise ValueError("The search is done")
+        if len(fitnesses) != len(self._candidates):
+            raise ValueError(f"Expected {len(self._candidates)} fitnesses, got {len(fitnesses)}")
+        self.nr_evaluations += len(fitnesses)
+        try:
+            self._candidates = self._search_steps.send(fitnesses)
+        except StopIteration:
+            self.done = True
+            self._candidates = []
+
+    def run(self, f_evaluate):
+        """
+        Ask and tell until the search is done
+        :param f_evaluate: function of a list of sequences that returns their fitnesses, e.g. BatchEvaluator.evaluate
+        of classes/general.py
+        :return: best sequence and its fitness
+        """
+        while not self.done:
+            self.tell(f_evaluate(self.ask()))
+        return self.best_sequence, self.best_fitness
+
+    def _stop(self, count):
+        """
+        Stop criterion of the functions, count is the iteration or evaluation count that is compared with the budget
+        """
+        if self.stop_criterium == "Time":
+            return time.time() - self.start >= self.time_limit
+        return count > self.budget
+
+    def _record(self, sequence, fitness):
+        """
+        Add a row to the columns of the history, a lower bound is not written as the fitness, see history_fitness of
+        classes/general.py
+        """
+        fitness, screened, cut_off = history_fitness(fitness)
+        row = {"Sequence": list(sequence), "Fitness": fitness, "Best_sequence": list(self.best_sequence),
+               "Best_fitness": self.best_fitness, "Time": time.time() - self.start, "Screened": screened,
+               "Cut_off": cut_off}
+        for column in self.COLUMNS:
+            if column in row:
+                self.history[column].append(row[column])
+
+    def results(self):
+        """
+        :return: DataFrame with the history, the same as the one written by the function of the method
+        """
+        return pd.DataFrame(self.history)
+
+    def write(self, output_file):
+        write_history(output_file, self.results())
+
+
+def random_state(seed=None):
+    """
+    :return: RandomState with seed, or np.random itself without a seed, which draws from the global state as the
+    functions do
+    """
+    if seed is None:
+        return np.random
+    return np.random.RandomState(seed)
@@ -3,24 +3,75 @@ import random
 import numpy as np
 import time
 import pandas as pd
+from classes.experiments import write_history
+from methods.ask_tell import AskTellOptimizer
 
 
-def best_insert(x, item, count_eval, f_eval):
+def evaluate_candidates(candidates, count_eval, f_eval, f_eval_batch=None, f_screen=None, incumbent=None,
+                        f_eval_cutoff=None):
+    """
+    Evaluate the candidates of a neighbourhood scan, one after another with f_eval or in one batch with f_eval_batch
+    :param f_eval_batch: optional function of a list of sequences and the evaluation count, which returns the list of
+    their fitnesses, e.g. BatchEvaluator.evaluate of classes/general.py with the cache of f_eval
+    :param f_screen: optional function of a sequence and the best fitness of the scan so far, which returns a lower
+    bound on the fitness of the sequence if it cannot beat it and None otherwise, e.g. FitnessBound.screen of
+    classes/lower_bound.py. Screened candidates are not simulated and get the bound as fitness, which does not change
+    the best candidate. In a batch, the candidates are screened against the incumbent before the others are sent.
+    :param incumbent: optional fitness that the best candidate has to beat to be of use, candidates that cannot beat
+    it are screened as well
+    :param f_eval_cutoff: optional function of a sequence, the evaluation count and the best fitness of the scan so
+    far, which is used instead of f_eval once there is a best fitness. It may stop the simulation as soon as the
+    fitness is known to be at least the cutoff and return a lower bound that is at least the cutoff, e.g.
+    evaluator_simpy of classes/general.py with cutoff. This does not change the best candidate either. It is only
+    used when the candidates are evaluated one after another.
+    """
+    if f_eval_batch is None:
+        fitnesses = []
+        best = incumbent
+        for j, candidate in enumerate(candidates):
+            fitness = None
+            if f_screen is not None and best is not None:
+                fitness = f_screen(candidate, best)
+            if fitness is None and f_eval_cutoff is not None and best is not None:
+                fitness = f_eval_cutoff(candidate, count_eval + j, best)
+            if fitness is None:
+                fitness = f_eval(candidate, count_eval + j)
+            if best is None or fitness < best:
+                best = fitness
+            fitnesses.append(fitness)
+        return fitnesses
+    fitnesses = [None] * len(candidates)
+    if f_screen is not None and incumbent is not None:
+        fitnesses = [f_screen(candidate, incumbent) for candidate in candidates]
+    rest = [j for j in range(0, len(candidates)) if fitnesses[j] is None]
+    for j, fitness in zip(rest, f_eval_batch([candidates[j] for j in rest], count_eval)):
+        fitnesses[j] = fitness
+    return fitnesses
+
+
+def best_candidate(candidates, fitnesses):
+    """
+    Candidate with the lowest fitness, ties are broken by the lowest index as in a scan one after another
+    """
+    best = 0
+    for k in range(1, len(candidates)):
+        if fitnesses[k] < fitnesses[best]:
+            best = k
+    return candidates[best], fitnesses[best]
+
+
+def best_insert(x, item, count_eval, f_eval, f_eval_batch=None, f_screen=None, f_eval_cutoff=None):
     print("Start best insert")
-    best_insert_x = np.insert(x, 0, item)
-    best_insert_fitness = f_eval(best_insert_x, count_eval)
-    count_eval += 1
-    for k in range(1, len(x) - 1):
-        test_x = np.insert(x, k, item)
-        test_fitness = f_eval(test_x, count_eval)
-        count_eval += 1
-        if test_fitness < best_insert_fitness:
-            best_insert_fitness = test_fitness
-            best_insert_x = test_x
+    candidates = [np.insert(x, k, item) for k in range(0, max(1, len(x) - 1))]
+    fitnesses = evaluate_candidates(candidates, count_eval, f_eval, f_eval_batch, f_screen,
+                                    f_eval_cutoff=f_eval_cutoff)
+    count_eval += len(candidates)
+    best_insert_x, best_insert_fitness = best_candidate(candidates, fitnesses)
     return best_insert_x, best_insert_fitness, count_eval
 
 
-def IterativeImprovementInsertion(x, fitness_x, count_eval, f_eval, budget=1000):
+def IterativeImprovementInsertion(x, fitness_x, count_eval, f_eval, budget=1000, f_eval_batch=None, f_screen=None,
+                                  f_eval_cutoff=None):
     print("Start iterated improvement")
     n = len(x)
     improve = True
@@ -33,20 +84,17 @@ def IterativeImprovementInsertion(x, fitness_x, count_eval, f_eval, budget=1000)
         for i in indices:
             item = x[i]
             y = np.delete(x, i)
-            best_insert_x = np.insert(y, 0, item)
-            best_insert_fitness = f_eval(best_insert_x, count_eval)
-            count_eval += 1
-            for k in range(1, n-2):
-                test_x = np.insert(y, k, item)
-                test_fitness = f_eval(test_x, count_eval)
-                count_eval += 1
-                if test_fitness < best_insert_fitness:
-                    best_insert_fitness = copy.copy(test_fitness)
-                    best_insert_x = copy.copy(test_x)
-
-                if count_eval >= budget:
-                    stop_loop = True
-                    break
+            # Insertion at position 0 is always evaluated, the positions 1, ..., n-3 until the budget is reached
+            nr_positions = 0
+            if n - 3 >= 1:
+                nr_positions = min(n - 3, max(1, budget - count_eval - 1))
+            candidates = [np.insert(y, k, item) for k in range(0, nr_positions + 1)]
+            fitnesses = evaluate_candidates(candidates, count_eval, f_eval, f_eval_batch, f_screen, fitness_x,
+                                            f_eval_cutoff)
+            count_eval += len(candidates)
+            best_insert_x, best_insert_fitness = best_candidate(candidates, fitnesses)
+            if nr_positions >= 1 and count_eval >= budget:
+                stop_loop = True
 
             if best_insert_fitness < fitness_x:
                 fitness_x = copy.copy(best_insert_fitness)
@@ -60,7 +108,8 @@ def IterativeImprovementInsertion(x, fitness_x, count_eval, f_eval, budget=1000)
 
 
 def iterated_greedy(n, f_eval, d=7, seed=1, time_limit=200, output_file="results_random_search.txt", printing=True,
-                     write=True, stop_criterium="Time", budget=400, init=None):
+                     write=True, stop_criterium="Time", budget=400, init=None, f_eval_batch=None, f_screen=None,
+                     f_eval_cutoff=None):
     random.seed(seed)
     np.random.seed(seed)
     count_eval = 1
@@ -93,7 +142,9 @@ def iterated_greedy(n, f_eval, d=7, seed=1, time_limit=200, output_file="results
     stop = False
 
     # First iterative improvement
-    x, fitness_x, count_eval = IterativeImprovementInsertion(x, fitness_x, count_eval, f_eval, budget=budget)
+    x, fitness_x, count_eval = IterativeImprovementInsertion(x, fitness_x, count_eval, f_eval, budget=budget,
+                                                             f_eval_batch=f_eval_batch, f_screen=f_screen,
+                                                             f_eval_cutoff=f_eval_cutoff)
 
     # Save results
     if fitness_x < fitness_best:
@@ -130,7 +181,8 @@ def iterated_greedy(n, f_eval, d=7, seed=1, time_limit=200, output_file="results
         # construction phase
         for j in range(0, d):
             item = to_remove_items[j]
-            x_, fitness_x_, count_eval = best_insert(x_, item, count_eval, f_eval)
+            x_, fitness_x_, count_eval = best_insert(x_, item, count_eval, f_eval, f_eval_batch, f_screen,
+                                                     f_eval_cutoff)
         print("After construction", x_, fitness_x_, len(x_))
 
         if stop_criterium == "Time":
@@ -150,7 +202,9 @@ def iterated_greedy(n, f_eval, d=7, seed=1, time_limit=200, output_file="results
                     fitness_best = copy.copy(fitness_x)
 
         else:
-            x_, fitness_x_, count_eval = IterativeImprovementInsertion(x_, fitness_x_, count_eval, f_eval, budget=budget)
+            x_, fitness_x_, count_eval = IterativeImprovementInsertion(x_, fitness_x_, count_eval, f_eval,
+                                                                     budget=budget, f_eval_batch=f_eval_batch,
+                                                                     f_screen=f_screen, f_eval_cutoff=f_eval_cutoff)
             if fitness_x_ < fitness_x:
                 x = copy.copy(x_)
                 fitness_x = copy.copy(fitness_x_)
@@ -183,6 +237,108 @@ def iterated_greedy(n, f_eval, d=7, seed=1, time_limit=200, output_file="results
         results['Best_fitness'] = best_fitnesses
         results["Number of evaluations"] = count_evaluations
         print("Total number of fitness evaluations", count_eval)
-        results.to_csv(output_file, header=True, index=False)
+        write_history(output_file, results)
+
+    return count_eval - 1, x_best
+
+
+class IteratedGreedy(AskTellOptimizer):
+    """
+    Ask/tell version of iterated_greedy: every ask returns the candidates of one neighbourhood scan, i.e. the insertion
+    positions of one item. The cutoff is only set in the scans of the iterative improvement, the construction needs
+    the fitness of its best insertion.
+    """
+    COLUMNS = ["Time", "Fitness", "Sequence", "Best_sequence", "Best_fitness", "Number of evaluations"]
+
+    def __init__(self, n, d=7, seed=1, stop_criterium="Time", time_limit=200, budget=400, init=None):
+        self.n = n
+        self.d = d
+        self.init = init
+        self.rng = np.random.RandomState(seed)
+        # Number of evaluations plus one, as count_eval of iterated_greedy
+        self.count_eval = 1
+        super().__init__(stop_criterium, time_limit, budget)
+
+    def _record(self, sequence, fitness):
+        super()._record(sequence, fitness)
+        self.history["Number of evaluations"].append(self.count_eval)
+
+    def _evaluate(self, candidates, cutoff=None):
+        self.cutoff = cutoff
+        fitnesses = yield candidates
+        self.count_eval += len(candidates)
+        return fitnesses
 
-    return count_eval - 1, x_best
\ No newline at end of file
+    def _best_insert(self, x, item):
+        candidates = [np.insert(x, k, item) for k in range(0, max(1, len(x) - 1))]
+        fitnesses = yield from self._evaluate(candidates)
+        return best_candidate(candidates, fitnesses)
+
+    def _iterative_improvement(self, x, fitness_x):
+        """
+        Same as IterativeImprovementInsertion
+        """
+        n = len(x)
+        improve = True
+        stop_loop = False
+        while improve:
+            improve = False
+            indices = [i for i in range(0, n-1)]
+            self.rng.shuffle(indices)
+            for i in indices:
+                item = x[i]
+                y = np.delete(x, i)
+                nr_positions = 0
+                if n - 3 >= 1:
+                    nr_positions = min(n - 3, max(1, self.budget - self.count_eval - 1))
+                candidates = [np.insert(y, k, item) for k in range(0, nr_positions + 1)]
+                fitnesses = yield from self._evaluate(candidates, cutoff=fitness_x)
+                best_insert_x, best_insert_fitness = best_candidate(candidates, fitnesses)
+                if nr_positions >= 1 and self.count_eval >= self.budget:
+                    stop_loop = True
+
+                if best_insert_fitness < fitness_x:
+                    fitness_x = best_insert_fitness
+                    x = copy.copy(best_insert_x)
+                    improve = True
+
+                if stop_loop:
+                    break
+        return x, fitness_x
+
+    def _search(self):
+        if self.init is None:
+            x = self.rng.permutation(np.arange(self.n))
+        else:
+            x = copy.copy(self.init)
+        fitness_x, = yield from self._evaluate([x])
+        self.start = time.time()
+        self.best_sequence = copy.copy(x)
+        self.best_fitness = fitness_x
+        self._record(x, fitness_x)
+
+        # First iterative improvement
+        x, fitness_x = yield from self._iterative_improvement(x, fitness_x)
+        if fitness_x < self.best_fitness:
+            self.best_sequence = copy.copy(x)
+            self.best_fitness = fitness_x
+        self._record(x, fitness_x)
+
+        while not self._stop(self.count_eval):
+            # Destruction and construction
+            x_ = copy.copy(x)
+            to_remove_idx = self.rng.choice(range(0, self.n), self.d, replace=False)
+            to_remove_items = x_[to_remove_idx]
+            x_ = np.delete(x_, to_remove_idx)
+            for item in to_remove_items:
+                x_, fitness_x_ = yield from self._best_insert(x_, item)
+
+            if not self._stop(self.count_eval):
+                x_, fitness_x_ = yield from self._iterative_improvement(x_, fitness_x_)
+            if fitness_x_ < fitness_x:
+                x = copy.copy(x_)
+                fitness_x = fitness_x_
+                if fitness_x < self.best_fitness:
+                    self.best_sequence = copy.copy(x)
+                    self.best_fitness = fitness_x
+            self._record(x, fitness_x)
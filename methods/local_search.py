@@ -3,19 +3,37 @@ import copy
 import random
 import pandas as pd
 import time
+from classes.columnar import is_columnar
+from classes.experiments import write_history
+from classes.history_log import HistoryLog
+from methods.ask_tell import AskTellOptimizer, random_state
 
 
-def swap_random(sequence):
+def swap_random(sequence, rng=np.random):
     seq = copy.copy(sequence)
-    i1, i2 = np.random.randint(0, len(seq), 2)
+    i1, i2 = rng.randint(0, len(seq), 2)
     seq[i1], seq[i2] = seq[i2], seq[i1]
     return seq
 
 
 def local_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
-                 output_file="results_local_search.txt", printing=True, write=True, init=None):
+                 output_file="results_local_search.txt", printing=True, write=True, init=None, f_screen=None,
+                 f_eval_cutoff=None):
+    """
+    :param f_screen: optional function of a sequence and the fitness of the current sequence, which returns a lower
+    bound on the fitness of the sequence if it cannot beat it and None otherwise, e.g. FitnessBound.screen of
+    classes/lower_bound.py
+    :param f_eval_cutoff: optional function of a sequence, the iteration and the fitness of the current sequence, which
+    may stop the simulation as soon as the fitness is known to be at least that of the current sequence and return a
+    WorseThanCutoff, e.g. evaluator_simpy of classes/general.py with cutoff
+    The history has a row per iteration with the current sequence. A candidate that is screened or cut off is never
+    accepted, so the Fitness of the current sequence is always simulated and the history does not have the columns
+    Screened and Cut_off of random_search.
+    """
     # Initialize
     iteration = 1
+    # A columnar history is written during the search as moves, instead of keeping all sequences in memory
+    log = HistoryLog(output_file, n, flags=False) if write and is_columnar(output_file) else None
     sequences = []
     fitnesses = []
     best_sequences = []
@@ -37,11 +55,14 @@ def local_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
     best_sequence = copy.copy(sequence)
     best_fitness = copy.copy(fitness)
     print(f"best fitness is {best_fitness}")
-    sequences.append(list(sequence.copy()))
-    fitnesses.append(fitness)
-    best_sequences.append(list(best_sequence.copy()))
-    best_fitnesses.append(best_fitness)
-    runtime.append(time.time() - start)
+    if log is not None:
+        log.append(sequence, fitness, best_sequence, best_fitness, time.time() - start)
+    elif write:
+        sequences.append(list(sequence.copy()))
+        fitnesses.append(fitness)
+        best_sequences.append(list(best_sequence.copy()))
+        best_fitnesses.append(best_fitness)
+        runtime.append(time.time() - start)
 
     stop = False
 
@@ -52,15 +73,26 @@ def local_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
         candidate_sequence = swap_random(sequence)
 
         # write new sequence to output file
-        candidate_fitness = f_eval(candidate_sequence, it)
+        # A candidate that cannot improve on the current sequence is rejected without simulating it
+        candidate_fitness = None
+        if f_screen is not None:
+            candidate_fitness = f_screen(candidate_sequence, fitness)
+        # or its simulation is stopped as soon as it cannot improve on it
+        if candidate_fitness is None and f_eval_cutoff is not None:
+            candidate_fitness = f_eval_cutoff(candidate_sequence, it, fitness)
+        if candidate_fitness is None:
+            candidate_fitness = f_eval(candidate_sequence, it)
         if printing:
             print(f"Candidate fitness {candidate_fitness}")
 
-        sequences.append(list(sequence.copy()))
-        fitnesses.append(fitness)
-        best_sequences.append(list(best_sequence.copy()))
-        best_fitnesses.append(best_fitness)
-        runtime.append(time.time() - start)
+        if log is not None:
+            log.append(sequence, fitness, best_sequence, best_fitness, time.time() - start)
+        elif write:
+            sequences.append(list(sequence.copy()))
+            fitnesses.append(fitness)
+            best_sequences.append(list(best_sequence.copy()))
+            best_fitnesses.append(best_fitness)
+            runtime.append(time.time() - start)
 
         # accept / reject
         if candidate_fitness < fitness:
@@ -88,13 +120,60 @@ def local_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
             print(f"Final best sequence so far is {best_sequence}, with fitness {best_fitness}")
             stop = True
 
-    results = pd.DataFrame()
-    results['Sequence'] = sequences
-    results['Fitness'] = fitnesses
-    results['Best_sequence'] = best_sequences
-    results['Best_fitness'] = best_fitnesses
-    results['Time'] = runtime
-    if write:
-        results.to_csv(output_file, header=True, index=False)
-
-    return it, best_sequence
\ No newline at end of file
+    if log is not None:
+        log.close()
+    elif write:
+        results = pd.DataFrame()
+        results['Sequence'] = sequences
+        results['Fitness'] = fitnesses
+        results['Best_sequence'] = best_sequences
+        results['Best_fitness'] = best_fitnesses
+        results['Time'] = runtime
+        write_history(output_file, results)
+
+    return it, best_sequence
+
+
+class LocalSearch(AskTellOptimizer):
+    """
+    Ask/tell version of local_search: every ask returns one candidate, a random swap of the current sequence. As the
+    one of local_search, the history does not have the columns Screened and Cut_off.
+    """
+    COLUMNS = ["Sequence", "Fitness", "Best_sequence", "Best_fitness", "Time"]
+
+    def __init__(self, n, stop_criterium="Time", time_limit=200, budget=400, init=None, seed=None):
+        """
+        :param seed: seed of the random numbers, without it the global state of np.random is used as in local_search
+        """
+        self.n = n
+        self.init = init
+        self.rng = random_state(seed)
+        self.iteration = 1
+        super().__init__(stop_criterium, time_limit, budget)
+
+    def _search(self):
+        if self.init is None:
+            sequence = self.rng.permutation(np.arange(self.n))
+        else:
+            sequence = copy.copy(self.init)
+        fitness, = yield [sequence]
+        self.start = time.time()
+        self.best_sequence = copy.copy(sequence)
+        self.best_fitness = fitness
+        self._record(sequence, fitness)
+
+        while True:
+            self.iteration += 1
+            candidate_sequence = swap_random(sequence, self.rng)
+            self.cutoff = fitness
+            candidate_fitness, = yield [candidate_sequence]
+            self._record(sequence, fitness)
+
+            if candidate_fitness < fitness:
+                sequence = copy.copy(candidate_sequence)
+                fitness = candidate_fitness
+                if fitness < self.best_fitness:
+                    self.best_sequence = copy.copy(sequence)
+                    self.best_fitness = candidate_fitness
+            if self._stop(self.iteration):
+                return
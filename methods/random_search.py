@@ -2,15 +2,35 @@ import numpy as np
 import copy
 import pandas as pd
 import time
+from classes.columnar import is_columnar
+from classes.experiments import write_history
+from classes.general import history_fitness
+from classes.history_log import HistoryLog
+from methods.ask_tell import AskTellOptimizer, random_state
 
 
 def random_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
-                  printing=True, write=True, output_file="results_random_search.txt"):
+                  printing=True, write=True, output_file="results_random_search.txt", f_screen=None,
+                  f_eval_cutoff=None):
+    """
+    :param f_screen: optional function of a sequence and the best fitness so far, which returns a lower bound on the
+    fitness of the sequence as a ScreenedOut if it cannot beat it and None otherwise, e.g. FitnessBound.screen of
+    classes/lower_bound.py
+    :param f_eval_cutoff: optional function of a sequence, the iteration and the best fitness so far, which may stop the
+    simulation as soon as the fitness is known to be at least the best fitness and return a WorseThanCutoff, e.g.
+    evaluator_simpy of classes/general.py with cutoff
+    The history has a row per sequence. The fitness of a sequence that is screened or cut off is not simulated, it is
+    NaN in the column Fitness and flagged in the column Screened or Cut_off.
+    """
     # Set-up algorithm parameters
 
     iteration = 1
+    # A columnar history is written during the search, instead of keeping all sequences in memory
+    log = HistoryLog(output_file, n) if write and is_columnar(output_file) else None
     sequences = []
     fitnesses = []
+    screened = []
+    cut_off = []
     best_sequences = []
     best_fitnesses = []
     runtime = []
@@ -28,11 +48,16 @@ def random_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
     best_fitness = fitness
 
     # Store data
-    best_sequences.append(list(best_sequence.copy()))
-    best_fitnesses.append(best_fitness)
-    sequences.append(list(sequence.copy()))
-    fitnesses.append(fitness)
-    runtime.append(time.time() - start)
+    if log is not None:
+        log.append(sequence, fitness, best_sequence, best_fitness, time.time() - start)
+    elif write:
+        best_sequences.append(list(best_sequence.copy()))
+        best_fitnesses.append(best_fitness)
+        sequences.append(list(sequence.copy()))
+        fitnesses.append(fitness)
+        screened.append(False)
+        cut_off.append(False)
+        runtime.append(time.time() - start)
     print(f"best fitness is {best_fitness}")
     stop = False
     it = 1
@@ -43,17 +68,32 @@ def random_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
         sequence = np.random.permutation(np.arange(n))
 
         # write new sequence to output file
-        fitness = f_eval(sequence, it)
+        # A sequence that cannot improve on the best sequence is not simulated, its fitness is the lower bound
+        fitness = None
+        if f_screen is not None:
+            fitness = f_screen(sequence, best_fitness)
+        # or its simulation is stopped as soon as it cannot improve on it, its fitness is then a lower bound as well
+        if fitness is None and f_eval_cutoff is not None:
+            fitness = f_eval_cutoff(sequence, it, best_fitness)
+        if fitness is None:
+            fitness = f_eval(sequence, it)
 
         if printing:
             print(f"New sequence is {sequence} with fitness {fitness}")
 
-        # Store data
-        best_sequences.append(list(best_sequence.copy()))
-        best_fitnesses.append(best_fitness)
-        sequences.append(list(sequence.copy()))
-        fitnesses.append(fitness)
-        runtime.append(time.time() - start)
+        # Store data, a lower bound is not written as the fitness
+        logged_fitness, is_screened, is_cut_off = history_fitness(fitness)
+        if log is not None:
+            log.append(sequence, logged_fitness, best_sequence, best_fitness, time.time() - start, is_screened,
+                       is_cut_off)
+        elif write:
+            best_sequences.append(list(best_sequence.copy()))
+            best_fitnesses.append(best_fitness)
+            sequences.append(list(sequence.copy()))
+            fitnesses.append(logged_fitness)
+            screened.append(is_screened)
+            cut_off.append(is_cut_off)
+            runtime.append(time.time() - start)
 
         if fitness < best_fitness:
             best_sequence = copy.copy(sequence)
@@ -71,13 +111,52 @@ def random_search(n, f_eval, time_limit=200, stop_criterium="Time", budget=400,
             print(f"Final best sequence so far is {best_sequence}, with fitness {best_fitness}")
             stop = True
 
-    results = pd.DataFrame()
-    results['Sequence'] = sequences
-    results['Fitness'] = fitnesses
-    results['Best_sequence'] = best_sequences
-    results['Best_fitness'] = best_fitnesses
-    results['Time'] = runtime
-
-    if write:
-        results.to_csv(output_file, header=True, index=False)
-    return it, best_sequence
\ No newline at end of file
+    if log is not None:
+        log.close()
+    elif write:
+        results = pd.DataFrame()
+        results['Sequence'] = sequences
+        results['Fitness'] = fitnesses
+        results['Best_sequence'] = best_sequences
+        results['Best_fitness'] = best_fitnesses
+        results['Time'] = runtime
+        results['Screened'] = screened
+        results['Cut_off'] = cut_off
+        write_history(output_file, results)
+    return it, best_sequence
+
+
+class RandomSearch(AskTellOptimizer):
+    """
+    Ask/tell version of random_search: every ask returns one random sequence. A fitness that is told as a ScreenedOut
+    or a WorseThanCutoff of classes/general.py is flagged in the history as in random_search.
+    """
+    def __init__(self, n, stop_criterium="Time", time_limit=200, budget=400, seed=None):
+        """
+        :param seed: seed of the random numbers, without it the global state of np.random is used as in random_search
+        """
+        self.n = n
+        self.rng = random_state(seed)
+        self.iteration = 1
+        super().__init__(stop_criterium, time_limit, budget)
+
+    def _search(self):
+        sequence = self.rng.permutation(np.arange(self.n))
+        fitness, = yield [sequence]
+        self.start = time.time()
+        self.best_sequence = copy.copy(sequence)
+        self.best_fitness = fitness
+        self._record(sequence, fitness)
+
+        while True:
+            self.iteration += 1
+            sequence = self.rng.permutation(np.arange(self.n))
+            self.cutoff = self.best_fitness
+            fitness, = yield [sequence]
+            self._record(sequence, fitness)
+
+            if fitness < self.best_fitness:
+                self.best_sequence = copy.copy(sequence)
+                self.best_fitness = fitness
+            if self._stop(self.iteration):
+                return
@@ -1,17 +1,103 @@
+import multiprocessing
+import sys
 import numpy as np
 import random
 import pandas as pd
-from classes.general import Settings, evaluator_simpy
+from classes.experiments import read_manifest, run_grid
+from classes.general import BatchEvaluator, FitnessCache, Settings, evaluator_simpy
+from classes.instance_store import load_plan
+from classes.lower_bound import FitnessBound
+from classes.simulator_3_fast import PrefixCache
 from methods.local_search import local_search
 from methods.random_search import random_search
 from methods.iterated_greedy import iterated_greedy
 
 
+def run_setting(setting, printing=False):
+    print(f"Start new instance {setting.instance}")
+    # Set seed
+    random.seed(setting.seed)
+    np.random.seed(setting.seed)
+    instance = load_plan(setting.instance)
+    file_name = setting.make_file_name()
+
+    cache = FitnessCache()
+    prefix_cache = PrefixCache()
+    f_eval = lambda x, i: evaluator_simpy(plan=instance, sequence=x, setting=setting, sim_time=setting.size*1000000,
+                                          printing=False, cache=cache, prefix_cache=prefix_cache)
+    # Candidates of which the lower bound shows that they cannot improve are not simulated, the simulation of the
+    # others is stopped as soon as they cannot improve anymore
+    bound = FitnessBound(plan=instance, setting=setting)
+    f_eval_cutoff = lambda x, i, cutoff: evaluator_simpy(plan=instance, sequence=x, setting=setting,
+                                                         sim_time=setting.size*1000000, printing=False, cache=cache,
+                                                         prefix_cache=prefix_cache, cutoff=cutoff, bound=bound)
+
+    if setting.init == "random":
+        init = None
+    elif setting.init == "sorted":
+        init = [i for i in range(0, setting.size)]
+
+    if setting.method == "local_search":
+        nr_iterations, best_sequence = local_search(n=setting.size, stop_criterium=setting.stop_criterium, budget=setting.budget, f_eval=f_eval,
+                                                    time_limit=setting.time_limit, output_file=f'results/results_algorithm/{file_name}', write=True,
+                                                    printing=printing, init=init, f_screen=bound.screen,
+                                                    f_eval_cutoff=f_eval_cutoff)
+    elif setting.method == "random_search":
+        nr_iterations, best_sequence = random_search(n=setting.size, stop_criterium=setting.stop_criterium,
+                                                    budget=setting.budget, f_eval=f_eval,
+                                                    output_file=f'results/results_algorithm/{file_name}', write=True,
+                                                    printing=printing, f_screen=bound.screen,
+                                                    f_eval_cutoff=f_eval_cutoff)
+    elif setting.method == "iterated_greedy":
+        # The insertion positions of a neighbourhood scan are simulated in parallel if there are multiple cores,
+        # except those that the cache or the lower bound settle
+        with BatchEvaluator(plan=instance, setting=setting, sim_time=setting.size*1000000,
+                            cache=cache) as batch_evaluator:
+            f_eval_batch = None
+            if batch_evaluator.processes > 1:
+                f_eval_batch = lambda xs, i: batch_evaluator.evaluate(xs)
+            nr_iterations, best_sequence = iterated_greedy(n=setting.size, init=init, stop_criterium=setting.budget, budget=setting.budget,
+                                                           f_eval=f_eval, printing=False, output_file=f'results/results_algorithm/{file_name}',
+                                                           f_eval_batch=f_eval_batch, f_screen=bound.screen,
+                                                           f_eval_cutoff=f_eval_cutoff)
+    print(f'{cache} for instance {setting.instance}')
+    print(f'{prefix_cache} for instance {setting.instance}')
+    print(f'{bound} for instance {setting.instance}')
+
+    # Save output in resource usage table
+    if setting.simulator == "simulator_1":
+        from classes.simulator_1 import Simulator
+    elif setting.simulator == "simulator_2":
+        from classes.simulator_2 import Simulator
+    elif setting.simulator == "simulator_3":
+        from classes.simulator_3 import Simulator
+    elif setting.simulator == "simulator_3_fast":
+        from classes.simulator_3_fast import Simulator
+    else:
+        print('WARNING: simulator not defined')
+
+    plan = load_plan(setting.instance)
+    sequence = best_sequence
+    plan.set_sequence(sequence)
+    simulator = Simulator(plan, printing=False)
+    makespan, lateness = simulator.simulate(SIM_TIME=setting.size*1000000, RANDOM_SEED=setting.seed, write=True,
+                                                     output_location=f"results/resource_usage/{file_name}")
+
+    return {"instance": setting.instance,
+            "method": setting.method,
+            "budget": setting.budget,
+            "fitness": setting.l1 * makespan + setting.l2 * lateness,
+            "makespan": makespan,
+            "lateness": lateness,
+            "costs": 0.5 * makespan + 0.5 * lateness,
+            "l1": setting.l1,
+            "l2": setting.l2,
+            "seed": setting.seed}
+
+
 if __name__ == '__main__':
-    printing = False
     save_resource_usage = False
     settings_list = []
-    data_table = []
     factory_name = "factory_1"
     for simulator in ["simulator_3"]:
         for size in [20, 40]:
@@ -46,65 +132,10 @@ if __name__ == '__main__':
                                                    objective=f'l1={l1}_l2={l2}', init=init, seed=seed, l1=l1, l2=l2)
                                 settings_list.append(setting)
 
-    for setting in settings_list:
-        print(f"Start new instance {setting.instance}")
-        # Set seed
-        random.seed(setting.seed)
-        np.random.seed(setting.seed)
-        instance = pd.read_pickle(f"factory_data/instances/instance_{setting.instance}.pkl")
-        file_name = setting.make_file_name()
-
-        f_eval = lambda x, i: evaluator_simpy(plan=instance, sequence=x, setting=setting, sim_time=size*1000000,
-                                              printing=False)
-
-        if setting.init == "random":
-            init = None
-        elif setting.init == "sorted":
-            init = [i for i in range(0, setting.size)]
-
-        if setting.method == "local_search":
-            nr_iterations, best_sequence = local_search(n=setting.size, stop_criterium=setting.stop_criterium, budget=setting.budget, f_eval=f_eval,
-                                                        time_limit=setting.time_limit, output_file=f'results/results_algorithm/{file_name}.txt', write=True,
-                                                        printing=printing, init=init)
-        elif setting.method == "random_search":
-            nr_iterations, best_sequence = random_search(n=setting.size, stop_criterium=setting.stop_criterium,
-                                                        budget=setting.budget, f_eval=f_eval,
-                                                        output_file=f'results/results_algorithm/{file_name}.txt', write=True,
-                                                        printing=printing)
-        elif setting.method == "iterated_greedy":
-            nr_iterations, best_sequence = iterated_greedy(n=setting.size, init=init, stop_criterium=setting.budget, budget=setting.budget,
-                                                           f_eval=f_eval, printing=False, output_file=f'results/results_algorithm/{file_name}.txt')
-
-        # Save output in resource usage table
-        if setting.simulator == "simulator_1":
-            from classes.simulator_1 import Simulator
-        elif setting.simulator == "simulator_2":
-            from classes.simulator_2 import Simulator
-        elif setting.simulator == "simulator_3":
-            from classes.simulator_3 import Simulator
-        else:
-            print('WARNING: simulator not defined')
-
-        plan = pd.read_pickle(f"factory_data/instances/instance_{setting.instance}.pkl")
-        sequence = best_sequence
-        plan.set_sequence(sequence)
-        simulator = Simulator(plan, printing=False)
-        makespan, lateness = simulator.simulate(SIM_TIME=size*1000000, RANDOM_SEED=setting.seed, write=True,
-                                                         output_location=f"results/resource_usage/{file_name}.csv")
-
-        data_table.append({"instance": setting.instance,
-                           "method": setting.method,
-                           "budget": setting.budget,
-                           "fitness": setting.l1 * makespan + setting.l2 * lateness,
-                           "makespan": makespan,
-                           "lateness": lateness,
-                           "costs": 0.5 * makespan + 0.5 * lateness,
-                           "l1": setting.l1,
-                           "l2": setting.l2,
-                           "seed": setting.seed})
-        dataframe = pd.DataFrame(data_table)
-        dataframe.to_csv("results/summary_tables/global search.csv")
-
-
-
-
+    # Independent settings run in parallel, optionally only shard i of nr_shards of the grid, e.g.
+    # python run_algorithm_global_optimization.py 0 4. Finished settings are skipped when the script is restarted.
+    shard, nr_shards = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (0, 1)
+    manifest = "results/summary_tables/global search manifest.jsonl"
+    run_grid(settings_list, run_setting, manifest=manifest, processes=multiprocessing.cpu_count(), shard=shard,
+             nr_shards=nr_shards)
+    read_manifest(manifest).to_csv("results/summary_tables/global search.csv")
@@ -1,7 +1,11 @@
+import multiprocessing
+import sys
 import numpy as np
 import copy
 from methods.local_search import local_search
-from classes.general import evaluator_simpy, Settings
+from classes.experiments import read_manifest, run_grid, write_history
+from classes.general import evaluator_simpy, FitnessCache, Settings, snapshot_simpy
+from classes.instance_store import load_plan
 import pandas as pd
 import time
 
@@ -10,34 +14,18 @@ def combine_sequences(fixed, i):
     return list(np.concatenate([fixed, i]))
 
 
-setting_list = []
-data_table = []
-simulator = "simulator_3"
-factory_name = "factory_1"
-init = "random"
-for seed in range(4, 5):
-    for size in [120, 240]:
-        for id in range(1, 10):
-            for l1 in [0.5]:
-                l2 = 1 - l1
-                for (k, m) in [(40, 10)]:
-                    for search_method in ["local_search"]:
-                        decompose = f'rolling_horizon_k={k}_m={m}'
-                        instance_name = f'{size}_{id}'
-                        setting = Settings(method=f"{decompose}_{search_method}",  instance=f'{size}_{id}_{factory_name}',
-                                           size=size, simulator=simulator, stop_criterium="Budget", budget=(size/20)*200,
-                                           objective=f'l1={l1}_l2={l2}', init="random", seed=seed, l1=l1, l2=l2, k=k, m=m)
-                        setting_list.append(setting)
-
-for setting in setting_list:
+def run_setting(setting):
     start = time.time()
     file_name = setting.make_file_name()
-    instance = pd.read_pickle(f"factory_data/instances/instance_{setting.instance}.pkl")
+    instance = load_plan(setting.instance)
 
     fixed = []
-    # Important, the f_eval considers the previously solved subinstances
+    snapshot = None
+    # Important, the f_eval considers the previously solved subinstances, which are resumed from their snapshot
+    cache = FitnessCache()
     f_eval = lambda x, i: evaluator_simpy(plan=instance, sequence=combine_sequences(fixed, x), setting=setting,
-                                          sim_time=setting.size*300000, printing=False)
+                                          sim_time=setting.size*300000, printing=False, cache=cache,
+                                          snapshot=snapshot)
 
     k = setting.k
     m = setting.m
@@ -55,6 +43,8 @@ for setting in setting_list:
         productionplan[i*m:i*m+k] = copy.copy(best_sequence)
         fixed = productionplan[0: (i+1) * m]
         print(f'We now fixed {fixed}')
+        # Simulate the fixed products once, the candidates of the next window resume from there
+        snapshot = snapshot_simpy(plan=instance, setting=setting, prefix=fixed, sim_time=setting.size*300000)
 
     if setting.simulator == "simulator_1":
         from classes.simulator_1 import Simulator
@@ -62,9 +52,11 @@ for setting in setting_list:
         from classes.simulator_2 import Simulator
     if setting.simulator == "simulator_3":
         from classes.simulator_3 import Simulator
+    if setting.simulator == "simulator_3_fast":
+        from classes.simulator_3_fast import Simulator
     simulator = Simulator(instance, printing=False)
     makespan, lateness = simulator.simulate(SIM_TIME=setting.size*300000, RANDOM_SEED=setting.seed, write=True,
-                                             output_location=f"results/resource_usage/{file_name}.csv")
+                                             output_location=f"results/resource_usage/{file_name}")
     runtime = time.time() - start
     results = pd.DataFrame()
     results['Makespan'] = [makespan]
@@ -74,19 +66,43 @@ for setting in setting_list:
     results['Sequence'] = [productionplan]
     results['Best_fitness'] = [setting.l1 * makespan + setting.l2 * lateness]
     results['Best_sequence'] = [productionplan]
-    results.to_csv(f'results/results_algorithm/{file_name}.txt', header=True, index=False)
-    data_table.append({"instance": setting.instance,
-                       "method": setting.method,
-                       "budget": setting.budget,
-                       "fitness": setting.l1 * makespan + setting.l2 * lateness,
-                       "makespan": makespan,
-                       "lateness": lateness,
-                       "costs": 0.5 * makespan + 0.5 * lateness,
-                       "l1": setting.l1,
-                       "l2": setting.l2,
-                       "seed": setting.seed,
-                       "time": runtime})
-    dataframe = pd.DataFrame(data_table)
-    dataframe.to_csv("results/summary_tables/rolling horizon")
+    write_history(f'results/results_algorithm/{file_name}', results)
+    return {"instance": setting.instance,
+            "method": setting.method,
+            "budget": setting.budget,
+            "fitness": setting.l1 * makespan + setting.l2 * lateness,
+            "makespan": makespan,
+            "lateness": lateness,
+            "costs": 0.5 * makespan + 0.5 * lateness,
+            "l1": setting.l1,
+            "l2": setting.l2,
+            "seed": setting.seed,
+            "time": runtime}
+
 
+if __name__ == '__main__':
+    setting_list = []
+    simulator = "simulator_3"
+    factory_name = "factory_1"
+    init = "random"
+    for seed in range(4, 5):
+        for size in [120, 240]:
+            for id in range(1, 10):
+                for l1 in [0.5]:
+                    l2 = 1 - l1
+                    for (k, m) in [(40, 10)]:
+                        for search_method in ["local_search"]:
+                            decompose = f'rolling_horizon_k={k}_m={m}'
+                            instance_name = f'{size}_{id}'
+                            setting = Settings(method=f"{decompose}_{search_method}",  instance=f'{size}_{id}_{factory_name}',
+                                               size=size, simulator=simulator, stop_criterium="Budget", budget=(size/20)*200,
+                                               objective=f'l1={l1}_l2={l2}', init="random", seed=seed, l1=l1, l2=l2, k=k, m=m)
+                            setting_list.append(setting)
 
+    # Independent settings run in parallel, optionally only shard i of nr_shards of the grid, e.g.
+    # python run_algorithm_rolling_horizon.py 0 4. Finished settings are skipped when the script is restarted.
+    shard, nr_shards = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (0, 1)
+    manifest = "results/summary_tables/rolling horizon manifest.jsonl"
+    run_grid(setting_list, run_setting, manifest=manifest, processes=multiprocessing.cpu_count(), shard=shard,
+             nr_shards=nr_shards)
+    read_manifest(manifest).to_csv("results/summary_tables/rolling horizon")
@@ -0,0 +1,56 @@
+import time
+import simpy
+import pandas as pd
+from classes.machine_pool import Machine, MachinePool
+"""
+This script compares the cost of a get/put cycle of the simpy.FilterStore with lambda filters, as formerly used by the
+simulators, with the MachinePool, for a growing number of resource groups. Every resource group has two machines and
+three processes that repeatedly claim a machine of their group, hold it for one time unit and put it back, such that
+there are always requests waiting.
+"""
+
+nr_machines = 2
+nr_processes = 3
+nr_cycles = 20
+
+
+def user(env, store, resource_group, filtered):
+    for _ in range(0, nr_cycles):
+        if filtered:
+            machine = yield store.get(lambda machine: machine.resource_group == resource_group)
+        else:
+            machine = yield store.get(resource_group)
+        yield env.timeout(1)
+        yield store.put(machine)
+
+
+def run(nr_groups, store_type):
+    env = simpy.Environment()
+    resource_names = [f'group_{g}' for g in range(0, nr_groups)]
+    capacity = [nr_machines for _ in range(0, nr_groups)]
+    if store_type == "FilterStore":
+        store = simpy.FilterStore(env, capacity=sum(capacity))
+        store.items = [Machine(name, j) for name in resource_names for j in range(0, nr_machines)]
+    else:
+        store = MachinePool(env, resource_names, capacity)
+    for name in resource_names:
+        for _ in range(0, nr_processes):
+            env.process(user(env, store, name, filtered=store_type == "FilterStore"))
+    start = time.perf_counter()
+    env.run()
+    return time.perf_counter() - start
+
+
+results = []
+for nr_groups in [1, 10, 100, 300]:
+    for store_type in ["FilterStore", "MachinePool"]:
+        runtime = run(nr_groups, store_type)
+        nr_cycles_total = nr_groups * nr_processes * nr_cycles
+        results.append({"Store": store_type,
+                        "Resource groups": nr_groups,
+                        "Get/put cycles": nr_cycles_total,
+                        "Time": runtime,
+                        "Microseconds per cycle": 1e6 * runtime / nr_cycles_total})
+        print(results[-1])
+
+print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,139 @@
+"""
+This script benchmarks the simulators on the first instance of every size and factory: the evaluations per second,
+the latency of a single evaluation (mean, median, percentiles), the peak memory of an evaluation and the number of
+events per evaluation. An evaluation is a metrics_only simulation of a random sequence, as in evaluator_simpy. The
+sequences and the simulation seed are fixed, so two runs of the benchmark simulate exactly the same sequences. The
+results are written to a JSON file together with the versions and the commit they were made with, e.g.
+    python run_benchmark_simulators.py --output results/benchmarks/before.json
+    python run_benchmark_simulators.py --output results/benchmarks/after.json --compare results/benchmarks/before.json
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import simpy
+from classes.instance_store import load_plan
+from classes.simulation_stats import SimulationStats
+
+SIMULATORS = ["simulator_1", "simulator_2", "simulator_3", "simulator_3_fast"]
+SIZES = [10, 20, 40, 60, 120, 240]
+FACTORIES = ["factory_1", "factory_2", "factory_3", "factory_4"]
+RANDOM_SEED = 1
+
+
+def evaluate(Simulator, plan, sequence, stats=None):
+    plan.set_sequence(sequence)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Simulator(plan).simulate(SIM_TIME=len(sequence) * 1000000, RANDOM_SEED=RANDOM_SEED,
+                                        metrics_only=True, stats=stats)
+
+
+def benchmark(simulator, size, factory, nr_evaluations):
+    Simulator = importlib.import_module(f"classes.{simulator}").Simulator
+    plan = load_plan(f"{size}_1_{factory}")
+    rng = np.random.RandomState(size)
+    sequences = [list(range(0, size))] + [list(rng.permutation(size)) for _ in range(1, nr_evaluations)]
+
+    # Warm up (imports, compiled plan), then time every evaluation on its own
+    evaluate(Simulator, plan, sequences[0])
+    latency = []
+    fitness = []
+    for sequence in sequences:
+        start = time.perf_counter()
+        makespan, tardiness = evaluate(Simulator, plan, sequence)
+        latency.append(time.perf_counter() - start)
+        fitness.append(makespan + tardiness)
+    latency = np.array(latency)
+
+    # Peak memory and events of one more evaluation, apart from the timing since tracing slows down the simulation
+    stats = SimulationStats()
+    tracemalloc.start()
+    evaluate(Simulator, plan, sequences[0], stats=stats)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"simulator": simulator,
+            "size": size,
+            "factory": factory,
+            "instance": f"{size}_1_{factory}",
+            "evaluations": nr_evaluations,
+            "evaluations_per_second": nr_evaluations / latency.sum(),
+            "latency_mean": latency.mean(),
+            "latency_min": latency.min(),
+            "latency_p50": np.percentile(latency, 50),
+            "latency_p90": np.percentile(latency, 90),
+            "latency_p99": np.percentile(latency, 99),
+            "latency_max": latency.max(),
+            "peak_memory_bytes": peak_memory,
+            "events_per_evaluation": stats.nr_events,
+            "events_per_second": stats.nr_events * nr_evaluations / latency.sum(),
+            # Sum of the objectives, to check that the benchmarks compared simulated the same
+            "fitness_checksum": sum(fitness)}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "simpy": simpy.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "random_seed": RANDOM_SEED}
+
+
+def compare(results, baseline_file):
+    """
+    Print the evaluations per second relative to the ones in baseline_file, a result file of an earlier run
+    """
+    with open(baseline_file) as file:
+        baseline = pd.DataFrame(json.load(file)["results"])
+    keys = ["simulator", "size", "factory"]
+    merged = pd.DataFrame(results).merge(baseline, on=keys, suffixes=("", "_baseline"))
+    merged["speedup"] = merged["evaluations_per_second"] / merged["evaluations_per_second_baseline"]
+    merged["same_results"] = merged["fitness_checksum"] == merged["fitness_checksum_baseline"]
+    print(merged[keys + ["evaluations_per_second_baseline", "evaluations_per_second", "speedup",
+                         "same_results"]].to_string(index=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the simulators")
+    parser.add_argument("--simulators", nargs="+", default=SIMULATORS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--factories", nargs="+", default=FACTORIES)
+    parser.add_argument("--evaluations", type=int, default=None,
+                        help="evaluations per instance, by default 2400 / size with a minimum of 5")
+    parser.add_argument("--output", default=f"results/benchmarks/simulators {time.strftime('%Y-%m-%d %H%M%S')}.json")
+    parser.add_argument("--compare", default=None, help="result file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    for simulator in args.simulators:
+        for size in args.sizes:
+            for factory in args.factories:
+                nr_evaluations = args.evaluations or max(5, 2400 // size)
+                results.append(benchmark(simulator, size, factory, nr_evaluations))
+                result = results[-1]
+                print(f"{simulator} {result['instance']}: {result['evaluations_per_second']:.1f} evaluations/s, "
+                      f"p50 {1000 * result['latency_p50']:.2f} ms, p99 {1000 * result['latency_p99']:.2f} ms, "
+                      f"peak memory {result['peak_memory_bytes'] / 2 ** 20:.2f} MB")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump({"metadata": metadata(), "results": results}, file, indent=1, default=lambda value: value.item())
+    print(f"Results are written to {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
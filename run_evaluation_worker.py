@@ -0,0 +1,31 @@
+import argparse
+import multiprocessing
+from classes.remote_evaluator import run_worker
+"""
+This script starts workers for a RemoteEvaluator of classes/remote_evaluator.py, which evaluate the sequences of the
+broker until it closes. The key of the broker is read from the environment variable EVALUATION_AUTHKEY, e.g.
+    EVALUATION_AUTHKEY=secret python run_evaluation_worker.py --host broker-host --port 6000 --processes 8
+    EVALUATION_AUTHKEY=secret python run_evaluation_worker.py --unix /tmp/evaluation.sock
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate sequences for a RemoteEvaluator")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6000)
+    parser.add_argument("--unix", default=None, help="path of the Unix socket of the broker, instead of host and port")
+    parser.add_argument("--processes", type=int, default=1, help="number of workers on this machine")
+    parser.add_argument("--connect-timeout", type=float, default=60,
+                        help="seconds to keep trying to connect while the broker is not listening yet")
+    args = parser.parse_args()
+
+    address = args.unix if args.unix is not None else (args.host, args.port)
+    if args.processes == 1:
+        run_worker(address, connect_timeout=args.connect_timeout)
+    else:
+        workers = [multiprocessing.Process(target=run_worker, args=(address,),
+                                           kwargs={"connect_timeout": args.connect_timeout})
+                   for _ in range(0, args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -1,5 +1,6 @@
+from classes.experiments import load_history
 from classes.general import Settings
-import pandas as pd
+from classes.instance_store import load_plan
 """
 This script can be used to obtain the resource usage of a solution to a problem instance
 obtained by one of the search algorithms
@@ -25,17 +26,16 @@ for setting in settings_list:
         from classes.simulator_2 import Simulator
     elif setting.simulator == "simulator_3":
         from classes.simulator_3 import Simulator
+    elif setting.simulator == "simulator_3_fast":
+        from classes.simulator_3_fast import Simulator
 
     # read in best sequence
-    data = pd.read_csv(f'results/results_algorithm/{file_name}.txt')
-    data_x = data["Best_sequence"].tolist()[-1]
-    data_x = data_x[1:-1].split(", ")
-    data_x = [int(i) for i in data_x]
+    history = load_history(f'results/results_algorithm/{file_name}')
+    sequence = history["Best_sequence"][-1].tolist()
 
-    plan = pd.read_pickle(f"factory_data/instances/instance_{setting.instance}.pkl")
-    sequence = data_x
+    plan = load_plan(setting.instance)
     for SEED in range(1, 2):
         plan.set_sequence(sequence)
         simulator = Simulator(plan, printing=True)
         makespan, tardiness = simulator.simulate(SIM_TIME=300000, RANDOM_SEED=SEED, write=True,
-                                                 output_location=f"results/resource_usage/{file_name}.csv")
\ No newline at end of file
+                                                 output_location=f"results/resource_usage/{file_name}")
\ No newline at end of file
@@ -1,6 +1,7 @@
 import altair_viewer
 import pandas as pd
 import altair as alt
+from classes.resource_usage import load_resource_usage
 
 """
 This script can be used to make a gannt chart from the resource usage table
@@ -13,7 +14,7 @@ for factory_name in ["factory_4"]:
     for instance in ['40_1']:
         for seed in range(1, 2):
             file_name = f'simulator={simulator_name}_instance_{instance}_{factory_name}_seed={seed}'
-            schedule = pd.read_csv(f'results/resource_usage/{file_name}.csv',  index_col=0)
+            schedule = load_resource_usage(f'results/resource_usage/{file_name}')
             print(schedule)
             print(list(schedule))
             schedule["Machine_id"] = [f'_id={i}' for i in schedule["Machine_id"].tolist()]
@@ -2,6 +2,7 @@ import altair_viewer
 import pandas as pd
 import altair as alt
 from classes.general import Settings
+from classes.resource_usage import load_resource_usage
 """
 This script can be used to make a gannt chart from the resource usage table
 for a specific solution to a problem instance. 
@@ -27,7 +28,7 @@ for factory_name in ["factory_1"]:
 for setting in settings_list:
     # determine file name
     file_name = setting.make_file_name()
-    schedule = pd.read_csv(f'results/resource_usage/{file_name}.csv',  index_col=0)
+    schedule = load_resource_usage(f'results/resource_usage/{file_name}')
     print(schedule)
     print(list(schedule))
     schedule["Machine_id"] = [f'_id={i}' for i in schedule["Machine_id"].tolist()]
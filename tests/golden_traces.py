@@ -0,0 +1,124 @@
+"""
+Golden traces of the baseline classes/simulator_3 (the SimPy simulator before the SimPy-free engine and the changes to
+the recording of the resource usage), with which tests/test_golden_traces.py checks the simulators. For every instance
+in factory_data/instances, the makespan, the tardiness and the resource usage rows are recorded for the cases of
+golden_cases. The traces are made once with
+
+    python tests/golden_traces.py
+
+which takes simulator_3 from the baseline commit and writes tests/golden_traces.npz.
+"""
+import contextlib
+import copy
+import glob
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+BASELINE = "c3174f3"
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_traces.npz")
+COLUMNS = ["Activity", "Product", "Resource", "Check_resource_type", "Machine_id", "Request moment",
+           "Retrieve moment", "Start", "Finish"]
+
+
+def instance_files():
+    return sorted(glob.glob("factory_data/instances/instance_*.pkl"))
+
+
+def instance_name(file_name):
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+def make_stochastic(plan):
+    """
+    :return: copy of plan in which the upper bound of every processing time is raised by 25%, at least 1
+    """
+    plan = copy.deepcopy(plan)
+    for product in plan.PRODUCTS:
+        for activity in product.ACTIVITIES:
+            low, high = activity.PROCESSING_TIME
+            activity.PROCESSING_TIME = [low, high + max(1, high // 4)]
+    return plan
+
+
+def golden_cases(plan):
+    """
+    Cases of an instance: the deterministic processing times of the instance, for which the seed does not matter,
+    and stochastic processing times with two seeds, such that the order of the random draws is checked as well
+    :return: list of (case, plan, sequence, seed)
+    """
+    n = len(plan.PRODUCT_IDS)
+    rng = np.random.RandomState(0)
+    permutations = [rng.permutation(n).tolist() for _ in range(0, 2)]
+    stochastic = make_stochastic(plan)
+    return [("identity", plan, list(range(0, n)), 1),
+            ("permutation", plan, permutations[0], 1),
+            ("stochastic_1", stochastic, permutations[0], 1),
+            ("stochastic_4", stochastic, permutations[1], 4)]
+
+
+def trace_rows(table, resource_names):
+    """
+    :param table: DataFrame of the resource usage with the columns of COLUMNS
+    :return: int64 array with a row per released machine, the resource groups as indices into resource_names
+    """
+    codes = {name: r for r, name in enumerate(resource_names)}
+    columns = []
+    for name in COLUMNS:
+        if name in ["Resource", "Check_resource_type"]:
+            columns.append(np.array([codes[value] for value in table[name]], dtype=np.int64))
+        else:
+            columns.append(table[name].to_numpy(dtype=np.int64))
+    return np.stack(columns, axis=1).reshape(len(table), len(COLUMNS))
+
+
+def simulate(Simulator, plan, sequence, seed):
+    """
+    :return: makespan, tardiness and the resource usage DataFrame of a simulation with the simulator class
+    """
+    plan.set_sequence(sequence)
+    simulator = Simulator(plan, printing=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        makespan, tardiness = simulator.simulate(SIM_TIME=len(sequence) * 1000000, RANDOM_SEED=seed, write=False)
+    table = simulator.resource_usage
+    if not isinstance(table, pd.DataFrame):
+        table = table.to_dataframe()
+    return makespan, tardiness, table
+
+
+def load_baseline_simulator(commit=BASELINE):
+    source = subprocess.run(["git", "show", f"{commit}:classes/simulator_3.py"], check=True, capture_output=True,
+                            text=True).stdout
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "baseline_simulator_3.py")
+    with open(path, "w") as file:
+        file.write(source)
+    spec = importlib.util.spec_from_file_location("baseline_simulator_3", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Simulator
+
+
+def make_golden_traces(commit=BASELINE):
+    from classes.general import load_instance
+    Simulator = load_baseline_simulator(commit)
+    traces = {}
+    for file_name in instance_files():
+        instance = load_instance(file_name)
+        for case, plan, sequence, seed in golden_cases(instance):
+            makespan, tardiness, table = simulate(Simulator, plan, sequence, seed)
+            key = f'{instance_name(file_name)}:{case}'
+            traces[f'{key}:objectives'] = np.array([makespan, tardiness], dtype=np.int64)
+            traces[f'{key}:rows'] = trace_rows(table, plan.FACTORY.RESOURCE_NAMES).astype(np.int32)
+        print(f'{file_name}: {len(golden_cases(instance))} cases')
+    np.savez_compressed(GOLDEN, **traces)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    make_golden_traces(*sys.argv[1:])
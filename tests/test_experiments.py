@@ -0,0 +1,28 @@
+import pytest
+from classes.experiments import read_manifest, run_grid
+from classes.general import Settings
+
+
+def run_setting(setting):
+    if setting.seed == 2:
+        raise RuntimeError("setting 2 fails")
+    return {"seed": setting.seed}
+
+
+def run_setting_fixed(setting):
+    return {"seed": setting.seed}
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_failed_setting_does_not_lose_rows(tmp_path, processes):
+    manifest = str(tmp_path / "manifest.jsonl")
+    settings_list = [Settings(seed=seed) for seed in range(0, 4)]
+    with pytest.raises(RuntimeError, match="1 of the 4 settings failed"):
+        run_grid(settings_list, run_setting, manifest, processes=processes)
+    assert sorted(read_manifest(manifest)["seed"]) == [0, 1, 3]
+
+    # A restart only runs the setting that failed
+    rows = run_grid(settings_list, run_setting_fixed, manifest, processes=processes)
+    assert [row["seed"] for row in rows] == [2]
+    assert sorted(read_manifest(manifest)["seed"]) == [0, 1, 2, 3]
+    assert run_grid(settings_list, run_setting_fixed, manifest, processes=processes) == []
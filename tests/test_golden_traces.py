@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from classes.general import load_instance, sample_durations
+from classes.simulator_3 import Simulator as ReferenceSimulator
+from classes.simulator_3_fast import Simulator as FastSimulator
+from tests.golden_traces import GOLDEN, golden_cases, instance_files, instance_name, simulate, trace_rows
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with np.load(GOLDEN) as traces:
+        yield dict(traces)
+
+
+def sorted_table(resource_usage):
+    # The rows of the finished activities of a state are recorded at the warm start, so the order of the rows differs
+    table = resource_usage.to_dataframe()
+    return table.sort_values(list(table.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("Simulator", [ReferenceSimulator, FastSimulator])
+@pytest.mark.parametrize("file_name", instance_files(), ids=instance_name)
+def test_golden_trace(golden, Simulator, file_name):
+    instance = load_instance(file_name)
+    for case, plan, sequence, seed in golden_cases(instance):
+        key = f'{instance_name(file_name)}:{case}'
+        makespan, tardiness, table = simulate(Simulator, plan, sequence, seed)
+        assert [makespan, tardiness] == golden[f'{key}:objectives'].tolist(), key
+        np.testing.assert_array_equal(trace_rows(table, plan.FACTORY.RESOURCE_NAMES), golden[f'{key}:rows'],
+                                      err_msg=key)
+
+
+@pytest.mark.parametrize("file_name", instance_files(), ids=instance_name)
+def test_warm_start(file_name):
+    # A simulation that is warm-started from the FactoryState halfway gives the same run as the one from time zero
+    instance = load_instance(file_name)
+    for case, plan, sequence, seed in golden_cases(instance):
+        sim_time = len(sequence) * 1000000
+        durations = sample_durations(plan, seed)
+        plan.set_sequence(sequence)
+        full = FastSimulator(plan, printing=False)
+        expected = full.simulate(SIM_TIME=sim_time, RANDOM_SEED=seed, write=False, durations=durations)
+        plan.set_sequence(sequence)
+        state = FastSimulator(plan, printing=False).factory_state(expected[0] // 2, RANDOM_SEED=seed,
+                                                                  durations=durations)
+        plan.set_sequence(sequence[len(state):])
+        warm = FastSimulator(plan, printing=False)
+        obtained = warm.simulate(SIM_TIME=sim_time, RANDOM_SEED=seed, write=False, durations=durations, state=state)
+        assert obtained == expected, case
+        assert sorted_table(warm.resource_usage).equals(sorted_table(full.resource_usage)), case
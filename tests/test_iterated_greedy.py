@@ -0,0 +1,31 @@
+import numpy as np
+from classes.general import BatchEvaluator, FitnessCache, ScreenedOut, Settings, evaluator_simpy, load_instance
+from methods.iterated_greedy import evaluate_candidates
+
+
+def test_batch_screens_and_caches():
+    plan = load_instance("factory_data/instances/instance_10_1_factory_1.pkl")
+    setting = Settings(size=10, simulator="simulator_3_fast", seed=1, l1=0.5, l2=0.5)
+    sim_time = 10 * 1000000
+    candidates = [np.random.RandomState(k).permutation(10) for k in range(0, 6)]
+    fitnesses = [evaluator_simpy(plan=plan, setting=setting, sequence=candidate, sim_time=sim_time)
+                 for candidate in candidates]
+    incumbent = sorted(fitnesses)[3]
+    # The screen rejects the candidates that cannot beat the incumbent, as a bound equal to their fitness would
+    screen = lambda x, cutoff: next((ScreenedOut(f) for c, f in zip(candidates, fitnesses)
+                                     if np.array_equal(c, x) and f >= cutoff), None)
+
+    cache = FitnessCache()
+    sent = []
+    with BatchEvaluator(plan=plan, setting=setting, sim_time=sim_time, processes=2, cache=cache) as batch_evaluator:
+        def f_eval_batch(xs, i):
+            sent.extend(xs)
+            return batch_evaluator.evaluate(xs)
+        obtained = evaluate_candidates(candidates, 1, None, f_eval_batch, screen, incumbent)
+        assert obtained == fitnesses
+        assert [isinstance(fitness, ScreenedOut) for fitness in obtained] == [f >= incumbent for f in fitnesses]
+        assert len(sent) == 3 and len(cache) == 3
+
+        # The second time, the candidates that were simulated are taken from the cache
+        assert batch_evaluator.evaluate(candidates) == fitnesses
+        assert cache.hits == 3 and len(cache) == 6
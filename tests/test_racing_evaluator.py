@@ -0,0 +1,50 @@
+import copy
+import numpy as np
+from classes.general import RacingEvaluator, Settings, load_instance
+from methods.local_search import local_search
+
+
+def load_stochastic_plan():
+    # instance_10_1_factory_1 with the upper bounds of the processing times raised by 25%
+    plan = copy.deepcopy(load_instance("factory_data/instances/instance_10_1_factory_1.pkl"))
+    for product in plan.PRODUCTS:
+        for activity in product.ACTIVITIES:
+            low, high = activity.PROCESSING_TIME
+            activity.PROCESSING_TIME = [low, high + max(1, high // 4)]
+    return plan
+
+
+def test_racing_follows_local_search():
+    plan = load_stochastic_plan()
+    n = len(plan.PRODUCT_IDS)
+    setting = Settings(size=n, simulator="simulator_3_fast", seed=1, l1=1, l2=1)
+    evaluator = RacingEvaluator(plan, setting, sim_time=n * 1000000, max_replications=8)
+    current = {}
+    decisions = []
+
+    def f_eval(sequence, iteration):
+        incumbent = evaluator.incumbent
+        fitness = evaluator(sequence)
+        # The acceptance rule of local_search
+        accepted = not current or fitness < current["fitness"]
+        decisions.append(accepted == (evaluator.incumbent != incumbent))
+        if accepted:
+            current["sequence"], current["fitness"] = np.array(sequence), fitness
+        return fitness
+
+    np.random.seed(1)
+    _, best_sequence = local_search(n, f_eval, stop_criterium="Budget", budget=80, printing=False, write=False)
+    assert all(decisions)
+    assert evaluator.incumbent == evaluator.make_key(current["sequence"])
+    assert evaluator.make_key(best_sequence) == evaluator.incumbent
+
+
+def test_racing_deterministic_plan_compares_fitness():
+    # Without variation the races are decided by the first replications, as a comparison of the fitnesses
+    plan = load_instance("factory_data/instances/instance_10_1_factory_1.pkl")
+    n = len(plan.PRODUCT_IDS)
+    setting = Settings(size=n, simulator="simulator_3_fast", seed=1, l1=1, l2=1)
+    evaluator = RacingEvaluator(plan, setting, sim_time=n * 1000000, common_random_numbers=False)
+    rng = np.random.RandomState(0)
+    fitnesses = [evaluator(rng.permutation(n)) for _ in range(0, 10)]
+    assert evaluator.incumbent_fitness == min(fitnesses)
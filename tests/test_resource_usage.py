@@ -0,0 +1,53 @@
+import contextlib
+import io
+import pytest
+from classes.general import load_instance
+from classes.simulator_3 import Simulator as ReferenceSimulator
+from classes.simulator_3_fast import Simulator as FastSimulator
+
+
+def load_plan():
+    plan = load_instance("factory_data/instances/instance_10_1_factory_1.pkl")
+    plan.set_sequence(list(range(0, len(plan.PRODUCT_IDS))))
+    return plan
+
+
+@pytest.mark.parametrize("Simulator", [ReferenceSimulator, FastSimulator])
+def test_truncated_simulation_raises(Simulator):
+    # With a simulation time of 100 the last products of the sequence have not released a machine yet
+    simulator = Simulator(load_plan(), printing=False)
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(ValueError, match="no finish time"):
+        simulator.simulate(SIM_TIME=100, RANDOM_SEED=1, write=False)
+
+
+@pytest.mark.parametrize("Simulator", [ReferenceSimulator, FastSimulator])
+def test_finished_simulation(Simulator):
+    simulator = Simulator(load_plan(), printing=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        makespan, tardiness = simulator.simulate(SIM_TIME=10000000, RANDOM_SEED=1, write=False)
+    assert makespan == simulator.resource_usage.finish[:len(simulator.resource_usage)].max()
+    assert tardiness >= 0
+
+
+@pytest.mark.parametrize("Simulator", [ReferenceSimulator, FastSimulator])
+def test_truncated_simulation_raises_metrics_only(Simulator):
+    # The unfinished products would otherwise keep a finish time of -inf, which hides them from the tardiness
+    simulator = Simulator(load_plan(), printing=False)
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(ValueError, match="no finish time"):
+        simulator.simulate(SIM_TIME=100, RANDOM_SEED=1, write=False, metrics_only=True)
+
+
+@pytest.mark.parametrize("Simulator", [ReferenceSimulator, FastSimulator])
+def test_metrics_only_matches_resource_usage(Simulator):
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = Simulator(load_plan(), printing=False).simulate(SIM_TIME=10000000, RANDOM_SEED=1, write=False)
+        obtained = Simulator(load_plan(), printing=False).simulate(SIM_TIME=10000000, RANDOM_SEED=1, write=False,
+                                                                   metrics_only=True)
+    assert obtained == expected
+
+
+def test_truncated_streamed_simulation_raises(tmp_path):
+    simulator = FastSimulator(load_plan(), printing=False)
+    with pytest.raises(ValueError, match="no finish time"):
+        simulator.simulate(SIM_TIME=100, RANDOM_SEED=1, write=True, output_location=str(tmp_path / "usage.csv"),
+                           chunk_size=16)